@@ -18,9 +18,29 @@
 
 
 # Do all imports and installs here
+import argparse
+import os
+import sys
 import pandas as pd
-import psycopg2
-from sql_queries import airport_insert, demographic_insert, immigration_insert, temperature_insert
+from sql_queries import airport_insert, demographic_insert, immigration_insert, temperature_insert, create_constraint_queries
+from sql_queries import drop_constraint_queries, index_catalog, plan_checks
+import analytics
+import eda
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+from common import checkpoint, db, indexes, profiling, sampling
+
+# number of rows inserted between two commits, each commit records a checkpoint
+COMMIT_EVERY = 10000
+
+# --resume continues the loads after the last chunk committed by an interrupted run
+# --sample 0.01 --seed 42 only reads a deterministic 1% of the I94 records (by cicid) and of the temperature
+# observations (by dt), for development runs; the smaller demographics and airport tables are read whole
+parser = argparse.ArgumentParser()
+parser.add_argument("--resume", action="store_true")
+sampling.add_arguments(parser)
+args = parser.parse_known_args()[0]
+sampler = sampling.from_args(args)
 
 
 # ### Step 1: Scope the Project and Gather Data
@@ -37,7 +57,18 @@ from sql_queries import airport_insert, demographic_insert, immigration_insert,
 
 # Read in the data here
 i94_path = '../../data/18-83510-I94-Data-2016/i94_apr16_sub.sas7bdat'
-df_i94 = pd.read_sas(i94_path, 'sas7bdat', encoding="ISO-8859-1")
+# The file is read once, chunk by chunk: the profile of Step 2 is computed in the same pass that keeps the
+# (sampled) records, the records left out are never all in memory. Both are cached, so a resumed run does not
+# read the SAS file again
+def read_i94():
+    chunks = []
+    i94_profile = eda.profile(i94_path, on_chunk=lambda chunk: chunks.append(sampler.filter(chunk, "cicid")),
+                              encoding="ISO-8859-1")
+    return i94_profile, pd.concat(chunks, ignore_index=True)
+
+
+i94_profile, df_i94 = checkpoint.cached(checkpoint.cache_dir('capstone.i94'), [i94_path], read_i94,
+                                        salt=str(sampler))
 
 
 # In[3]:
@@ -55,26 +86,40 @@ df_i94.head(20)
 
 
 fname = '../../data2/GlobalLandTemperaturesByCity.csv'
-df_temp = pd.read_csv(fname)
 
 
 # In[5]:
 
 
-df_temp.head(20)
+# The temperature file is read once: the profile of every column (with enough most frequent values to list
+# all the countries) is computed in the same streaming pass that keeps the United States rows (of the sampled
+# dates), the whole file is never in memory. Both are cached until the end of the run, like the I94 data
+TEMPERATURE_TOP = 500
+
+
+def read_temperature():
+    us_chunks = []
+    temperature_profile = eda.profile(fname, top=TEMPERATURE_TOP, on_chunk=lambda chunk: us_chunks.append(
+        sampler.filter(chunk[chunk["Country"] == "United States"], "dt")))
+    return temperature_profile, pd.concat(us_chunks, ignore_index=True)
+
+
+temperature_profile, df_temp_us = checkpoint.cached(checkpoint.cache_dir('capstone.temperature'), [fname],
+                                                    read_temperature, salt=str(sampler))
+eda.to_frame(temperature_profile, top=10)
 
 
 # In[6]:
 
 
 # find all unique country codes in temperature data to find used name for United States 
-set(df_temp["Country"].values)
+[country for country, count in temperature_profile["Country"]["top"]]
 
 
 # In[7]:
 
 
-df_temp_us = df_temp[df_temp["Country"] == "United States"]
+# only the United States rows (of the sampled dates), kept while profiling the file
 df_temp_us.head()
 
 
@@ -102,6 +147,8 @@ df_demographics.head(20)
 
 
 df_airport_codes = pd.read_csv("./airport-codes_csv.csv")
+# every US airport, before the table is reduced to the I94 ports: used to place the temperature stations in a state
+df_us_airports = df_airport_codes[df_airport_codes["iso_country"] == "US"].copy()
 
 
 # In[11]:
@@ -119,7 +166,8 @@ df_airport_codes.head(20)
 # In[12]:
 
 
-df_i94.describe()
+# computed while reading the file in Step 1
+eda.to_frame(i94_profile)
 
 
 # In[13]:
@@ -131,7 +179,7 @@ df_temp_us.describe()
 # In[14]:
 
 
-df_airport_codes.describe()
+eda.to_frame(eda.profile("./airport-codes_csv.csv"))
 
 
 # #### Cleaning Steps
@@ -196,8 +244,30 @@ df_airport_codes.head(20)
 # 
 
 # After running create_tables.py, insert the data into the database
-conn = psycopg2.connect("host=127.0.0.1 dbname=sparkifydb user=student password=student")
-cur = conn.cursor()
+# (set SPARKIFY_PROFILE=time to get a JSON summary of every load step)
+profiling.start('capstone_load')
+conn = db.get_pool().getconn()
+checkpoint.ensure_table(conn)
+
+
+def load_table(loader, df, insert_query):
+    """
+    Inserts the rows of df in chunks of COMMIT_EVERY rows, each committed with a checkpoint,
+    skipping the chunks committed by a previous run with --resume.
+    @param loader: checkpoint name of the load
+    @param df: rows to insert, in the column order of insert_query
+    @param insert_query: INSERT statement of the table
+    """
+    num_chunks = (len(df) + COMMIT_EVERY - 1) // COMMIT_EVERY
+
+    def load_chunk(tx, i):
+        for index, row in df.iloc[i * COMMIT_EVERY:(i + 1) * COMMIT_EVERY].iterrows():
+            tx.execute(insert_query, list(row.values))
+
+    def describe(i):
+        return "rows {}-{} of {}".format(i * COMMIT_EVERY, min(len(df), (i + 1) * COMMIT_EVERY), len(df))
+
+    checkpoint.run_chunks(conn, loader, num_chunks, load_chunk, describe, resume=args.resume)
 
 
 # In[21]:
@@ -208,34 +278,57 @@ df_airport_codes.head()
 df_airport_codes.drop(columns=["port_code"], inplace=True)
 df_airport_codes = df_airport_codes[["iata_code", "name", "type", "local_code", "coordinates", "port_city", "elevation_ft", "continent", "iso_country", "iso_region", "municipality", "gps_code"]]
 
-for index, row in df_airport_codes.iterrows():
-    cur.execute(airport_insert, list(row.values))
-    conn.commit()
+with profiling.stage('load_airports') as stage:
+    load_table('capstone.airports', df_airport_codes, airport_insert)
+    stage.add(rows=len(df_airport_codes))
 
 
 # In[22]:
 
 
-for index, row in df_demographics.iterrows():
-    cur.execute(demographic_insert, list(row.values))
-    conn.commit()
+with profiling.stage('load_demographics') as stage:
+    load_table('capstone.demographics', df_demographics, demographic_insert)
+    stage.add(rows=len(df_demographics))
 
 
 # In[23]:
 
 
-for index, row in df_i94_filtered.iterrows():
-    cur.execute(immigration_insert, list(row.values))
-    conn.commit()
+with profiling.stage('load_immigrations') as stage:
+    load_table('capstone.immigrations', df_i94_filtered, immigration_insert)
+    stage.add(rows=len(df_i94_filtered))
 
 
 # In[24]:
 
 
-for index, row in df_temp_us.iterrows():
-    cur.execute(temperature_insert, list(row.values))
+with profiling.stage('load_temperature') as stage:
+    load_table('capstone.temperature', df_temp_us, temperature_insert)
+    stage.add(rows=len(df_temp_us))
+
+
+# Build the analytical fact table: port -> city -> demographics and arrival month -> temperature are joined
+# once here, on normalized (city, state) keys, so the analytical queries read a single narrow table
+with profiling.stage('build_arrivals') as stage:
+    dim_city, df_arrivals = analytics.build_arrivals(df_i94_filtered, df_port_locations, df_demographics, df_temp_us,
+                                                     df_us_airports)
+    stage.add(rows=len(df_arrivals))
+with profiling.stage('load_arrivals') as stage:
+    checkpoint.run_chunks(conn, 'capstone.arrivals', 1,
+                          lambda tx, i: analytics.load_arrivals(tx.cursor, dim_city, df_arrivals), resume=args.resume)
+    stage.add(rows=len(dim_city) + len(df_arrivals))
+
+
+# Add the primary keys now that the bulk load is done (a resumed run may have added them already)
+cur = conn.cursor()
+with profiling.stage('constraints'):
+    for query in drop_constraint_queries + create_constraint_queries:
+        cur.execute(query)
     conn.commit()
 
+# Build the indexes of the analytical lookups and refresh the table statistics
+with profiling.stage('indexes'):
+    indexes.build_indexes(conn, index_catalog)
 
 
 # Perform quality checks here
@@ -259,8 +352,19 @@ conn.commit()
 if cur.rowcount < 1:
     print("No data found in table temperature")
 
-
-
-
-
-
+cur.execute("SELECT COUNT(*), COUNT(city_id), COUNT(avg_temperature) FROM arrivals")
+arrivals, with_city, with_temperature = cur.fetchone()
+conn.commit()
+if arrivals < 1:
+    print("No data found in table arrivals")
+else:
+    print(f"{with_city / arrivals:.1%} of the arrivals matched a city, {with_temperature / arrivals:.1%} a temperature")
+
+# Make sure the analytical lookups are served by indexes
+with profiling.stage('plan_checks'):
+    indexes.assert_index_usage(conn, plan_checks)
+
+checkpoint.clear_cache('capstone.i94')
+checkpoint.clear_cache('capstone.temperature')
+db.close_pools()
+profiling.finish()
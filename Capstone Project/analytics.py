@@ -0,0 +1,188 @@
+import io
+import re
+
+import pandas as pd
+from sql_queries import arrivals_partition_create, arrivals_copy, city_copy
+
+
+def normalize_key(value):
+    """
+    Normalizes a free-text city or state name into a join key: upper case, punctuation removed, single spaces.
+    @param value: city or state name
+    @return: normalized key, '' for missing values
+    """
+    if not isinstance(value, str):
+        return ''
+    value = re.sub(r'[^A-Z0-9 ]', ' ', value.upper())
+    return ' '.join(value.split())
+
+
+def build_city_dimension(df_demographics):
+    """
+    Builds one row per city of the demographics data, with an integer city_id.
+    The demographics file has one row per city and race, the city level columns are repeated on each.
+    @param df_demographics: us-cities-demographics data
+    @return: DataFrame with city_id, city_key, state_code and the city demographics
+    """
+    df = df_demographics.rename(columns={
+        "City": "city", "State Code": "state_code", "Median Age": "median_age",
+        "Total Population": "total_population", "Foreign-born": "foreign_born",
+        "Average Household Size": "average_household_size"})
+    df["city_key"] = df["city"].map(normalize_key)
+    df = df.drop_duplicates(subset=["city_key", "state_code"])
+    df = df.sort_values(["state_code", "city_key"]).reset_index(drop=True)
+    df["city_id"] = df.index + 1
+    for column in ["total_population", "foreign_born"]:
+        df[column] = df[column].astype("Int64")
+    return df[["city_id", "city_key", "state_code", "city", "median_age", "total_population",
+               "foreign_born", "average_household_size"]]
+
+
+def build_port_cities(df_port_locations, dim_city):
+    """
+    Resolves each I94 port code to the normalized name of its city and, when the city has demographics, to its city_id.
+    @param df_port_locations: port_code, port_city, port_state parsed from I94_SAS_Labels_Descriptions.SAS
+    @param dim_city: city dimension from build_city_dimension
+    @return: DataFrame with port_code, city_key, state_code and city_id (NaN when unknown)
+    """
+    ports = df_port_locations.copy()
+    ports["city_key"] = ports["port_city"].map(normalize_key)
+    ports["state_code"] = ports["port_state"].str.strip().str[:2]
+    ports = ports.merge(dim_city[["city_id", "city_key", "state_code"]], on=["city_key", "state_code"], how="left")
+    return ports[["port_code", "city_key", "state_code", "city_id"]].drop_duplicates(subset=["port_code"])
+
+
+# Largest distance, in degrees, between a temperature station and an airport of the same city name for the
+# station to be placed in the state of the airport; the stations of the data set are on a ~1 degree grid
+MAX_STATION_AIRPORT_DEGREES = 2.0
+
+
+def parse_coordinate(value):
+    """
+    Converts a coordinate of the temperature data set, e.g. "32.95N" or "100.53W", into signed degrees.
+    """
+    value = str(value).strip()
+    degrees = float(value[:-1])
+    return -degrees if value[-1] in "SW" else degrees
+
+
+def resolve_temperature_states(df_temp_us, dim_city, df_airport_codes):
+    """
+    Places every temperature station (City, Latitude, Longitude) in a state, since city names are not unique
+    across states (Portland OR / ME, Springfield IL / MA / MO...). A station takes the state of the nearest
+    US airport of the same city name within MAX_STATION_AIRPORT_DEGREES; otherwise, the state of the city in
+    the demographics if the name is in a single state there and is used by a single station. Stations that
+    cannot be placed are left out rather than attached to the wrong state.
+    @param df_temp_us: GlobalLandTemperaturesByCity rows of the United States
+    @param dim_city: city dimension from build_city_dimension
+    @param df_airport_codes: airport codes data, with municipality, iso_country, iso_region and coordinates
+    @return: DataFrame with City, Latitude, Longitude, city_key and state_code
+    """
+    stations = df_temp_us[["City", "Latitude", "Longitude"]].drop_duplicates().reset_index(drop=True)
+    stations["city_key"] = stations["City"].map(normalize_key)
+    stations["lat"] = stations["Latitude"].map(parse_coordinate)
+    stations["lon"] = stations["Longitude"].map(parse_coordinate)
+
+    airports = df_airport_codes[df_airport_codes["iso_country"] == "US"].dropna(subset=["municipality", "coordinates"])
+    coordinates = airports["coordinates"].str.split(",", n=1)
+    airports = pd.DataFrame({
+        "city_key": airports["municipality"].map(normalize_key),
+        "airport_state": airports["iso_region"].str[3:],
+        "airport_lon": coordinates.str[0].astype(float),
+        "airport_lat": coordinates.str[1].astype(float),
+    })
+
+    candidates = stations.reset_index().merge(airports, on="city_key")
+    candidates["distance"] = ((candidates["lat"] - candidates["airport_lat"]) ** 2 +
+                              (candidates["lon"] - candidates["airport_lon"]) ** 2) ** 0.5
+    candidates = candidates[candidates["distance"] <= MAX_STATION_AIRPORT_DEGREES]
+    nearest = candidates.loc[candidates.groupby("index")["distance"].idxmin()].set_index("index")["airport_state"]
+    stations["state_code"] = nearest
+
+    states_per_name = dim_city.groupby("city_key")["state_code"].agg(["nunique", "first"])
+    single_state = states_per_name[states_per_name["nunique"] == 1]["first"]
+    stations_per_name = stations["city_key"].map(stations["city_key"].value_counts())
+    fallback = stations["city_key"].map(single_state).where(stations_per_name == 1)
+    stations["state_code"] = stations["state_code"].fillna(fallback)
+
+    return stations.dropna(subset=["state_code"])[["City", "Latitude", "Longitude", "city_key", "state_code"]]
+
+
+def build_monthly_temperature(df_temp_us, stations):
+    """
+    Averages the temperature of each city per calendar month over all the years of the data set,
+    so arrivals of any year can be matched with the usual temperature of their month.
+    @param df_temp_us: GlobalLandTemperaturesByCity rows of the United States
+    @param stations: stations placed in a state by resolve_temperature_states
+    @return: DataFrame with city_key, state_code, month and avg_temperature
+    """
+    df = df_temp_us[["City", "Latitude", "Longitude", "dt", "AverageTemperature"]].merge(
+        stations, on=["City", "Latitude", "Longitude"])
+    df = pd.DataFrame({
+        "city_key": df["city_key"],
+        "state_code": df["state_code"],
+        "month": pd.to_datetime(df["dt"]).dt.month,
+        "avg_temperature": df["AverageTemperature"],
+    })
+    return df.groupby(["city_key", "state_code", "month"], as_index=False)["avg_temperature"].mean()
+
+
+def build_arrivals(df_i94, df_port_locations, df_demographics, df_temp_us, df_airport_codes):
+    """
+    Resolves the port -> city -> demographics and arrival month -> temperature joins once, at load time.
+    @param df_i94: cleaned I94 immigration data
+    @param df_port_locations: port_code, port_city, port_state parsed from the SAS labels
+    @param df_demographics: us-cities-demographics data
+    @param df_temp_us: GlobalLandTemperaturesByCity rows of the United States
+    @param df_airport_codes: airport codes data, used to place the temperature stations in a state; all the
+                             airports, not only the I94 ports, so stations of cities without a port are placed
+    @return: city dimension and the arrivals fact table
+    """
+    dim_city = build_city_dimension(df_demographics)
+    ports = build_port_cities(df_port_locations, dim_city)
+    stations = resolve_temperature_states(df_temp_us, dim_city, df_airport_codes)
+    temperature = build_monthly_temperature(df_temp_us, stations)
+
+    arrival_date = pd.to_datetime("1960-01-01") + pd.to_timedelta(df_i94["arrdate"], unit="D")
+    arrivals = pd.DataFrame({
+        "cicid": df_i94["cicid"].astype("int64"),
+        "arrival_month": (arrival_date.dt.year * 100 + arrival_date.dt.month).astype("int32"),
+        "arrival_date": arrival_date.dt.date,
+        "port_code": df_i94["i94port"],
+        "month": arrival_date.dt.month,
+        "visa": df_i94["i94visa"].astype("int16"),
+        "mode": df_i94["i94mode"].astype("int16"),
+        "age": df_i94["i94bir"].astype("int16"),
+        "gender": df_i94["gender"],
+    })
+    arrivals = arrivals.merge(ports, on="port_code", how="left")
+    arrivals = arrivals.merge(temperature, on=["city_key", "state_code", "month"], how="left")
+    arrivals["city_id"] = arrivals["city_id"].astype("Int32")
+
+    fact = arrivals[["cicid", "arrival_month", "arrival_date", "city_id", "visa", "mode", "age", "gender",
+                     "avg_temperature"]]
+    return dim_city, fact
+
+
+def _copy(cur, copy_statement, df, chunk_size):
+    for start in range(0, len(df), chunk_size):
+        buffer = io.StringIO()
+        df.iloc[start:start + chunk_size].to_csv(buffer, index=False, header=False)
+        buffer.seek(0)
+        cur.copy_expert(copy_statement, buffer)
+
+
+def load_arrivals(cur, dim_city, arrivals, chunk_size=100000):
+    """
+    Loads the city dimension and the arrivals fact table with COPY, creating the monthly partitions needed.
+    The caller commits, e.g. with the checkpoint of the load.
+    @param cur: psycopg2 cursor on the database
+    @param dim_city: city dimension from build_arrivals
+    @param arrivals: arrivals fact table from build_arrivals
+    @param chunk_size: rows sent per COPY
+    """
+    for month in sorted(arrivals["arrival_month"].unique()):
+        cur.execute(arrivals_partition_create.format(month=int(month)))
+    _copy(cur, city_copy, dim_city.drop(columns=["city_key"]), chunk_size)
+    _copy(cur, arrivals_copy, arrivals, chunk_size)
+    print(f"{len(dim_city)} cities and {len(arrivals)} arrivals loaded.")
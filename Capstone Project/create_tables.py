@@ -1,5 +1,10 @@
-import psycopg2
-from sql_queries import create_table_queries, drop_table_queries
+import argparse
+import os
+import sys
+from sql_queries import create_table_queries, drop_table_queries, drop_constraint_queries, table_names, index_catalog
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+from common import checkpoint, db, indexes, schema
 
 
 def create_database():
@@ -9,7 +14,7 @@ def create_database():
     """
     
     # connect to default database
-    conn = psycopg2.connect("host=127.0.0.1 dbname=studentdb user=student password=student")
+    conn = db.connect(db.ADMIN_DBNAME)
     conn.set_session(autocommit=True)
     cur = conn.cursor()
     
@@ -21,7 +26,7 @@ def create_database():
     conn.close()    
     
     # connect to sparkify database
-    conn = psycopg2.connect("host=127.0.0.1 dbname=sparkifydb user=student password=student")
+    conn = db.connect()
     cur = conn.cursor()
     
     return cur, conn
@@ -35,7 +40,7 @@ def drop_tables(cur, conn):
     """
     for query in drop_table_queries:
         cur.execute(query)
-        conn.commit()
+    conn.commit()
 
 
 def create_tables(cur, conn):
@@ -46,27 +51,45 @@ def create_tables(cur, conn):
     """
     for query in create_table_queries:
         cur.execute(query)
-        conn.commit()
+    conn.commit()
 
 
 def main():
     """
-    - Drops (if exists) and Creates the sparkify database. 
-    
-    - Establishes connection with the sparkify database and gets
-    cursor to it.  
-    
-    - Drops all the tables.  
-    
-    - Creates all tables needed. 
-    
-    - Finally, closes the connection. 
+    Resets the sparkify database, using one of the following modes:
+
+    - swap (default): creates all tables in a shadow schema and swaps them in place of
+      the current ones in a single transaction.
+
+    - truncate: empties all tables, resets their sequences and drops the indexes of
+      the index catalog, which the ETL builds after the load. The fastest option
+      between test runs.
+
+    - database: drops (if exists) and creates the sparkify database, then creates
+      all tables. Used automatically when the database does not exist yet.
+
+    The checkpoints of interrupted loads are cleared, so a following --resume starts over.
+
+    Usage: python create_tables.py [--mode swap|truncate|database]
     """
-    cur, conn = create_database()
-    
-    drop_tables(cur, conn)
-    create_tables(cur, conn)
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--mode", choices=["swap", "truncate", "database"], default="swap")
+    args = parser.parse_args()
+
+    if args.mode == "database" or not db.database_exists():
+        cur, conn = create_database()
+        drop_tables(cur, conn)
+        create_tables(cur, conn)
+    elif args.mode == "swap":
+        conn = db.connect()
+        schema.swap_schema(conn, create_table_queries, table_names)
+    else:
+        conn = db.connect()
+        # constraints and indexes are built again after the load
+        schema.truncate_tables(conn, table_names, drop_constraint_queries + indexes.drop_index_queries(index_catalog))
 
+    # the tables are empty again, progress recorded by interrupted loads no longer applies
+    checkpoint.clear(conn)
     conn.close()
 
 
@@ -0,0 +1,255 @@
+import hashlib
+import json
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+
+# Number of registers of the distinct count sketches is 2 ** HLL_PRECISION, relative error ~ 1.04 / sqrt(4096) = 1.6%
+HLL_PRECISION = 12
+
+# Values kept per column to find the most frequent ones; counts of values pruned early are underestimated
+TOP_CANDIDATES = 1000
+
+CHUNK_ROWS = 200000
+
+PROFILE_SUFFIX = '.profile.json'
+
+
+class HyperLogLog:
+    """
+    Mergeable approximate distinct counter (HyperLogLog), fed with 64 bit hashes of the values.
+    """
+
+    def __init__(self, precision=HLL_PRECISION):
+        self.precision = precision
+        self.registers = np.zeros(1 << precision, dtype=np.uint8)
+
+    def add_hashes(self, hashes):
+        """
+        Adds the values of a uint64 array of hashes, e.g. from pd.util.hash_pandas_object.
+        """
+        if len(hashes) == 0:
+            return
+        hashes = np.asarray(hashes, dtype=np.uint64)
+        rest_bits = 64 - self.precision
+        index = (hashes >> np.uint64(rest_bits)).astype(np.int64)
+        rest = hashes & np.uint64((1 << rest_bits) - 1)
+        # rank = position of the leftmost 1 bit in the remaining bits
+        bit_length = np.zeros(len(rest), dtype=np.int64)
+        nonzero = rest > 0
+        bit_length[nonzero] = np.floor(np.log2(rest[nonzero].astype(np.float64))).astype(np.int64) + 1
+        rank = (rest_bits - bit_length + 1).astype(np.uint8)
+        np.maximum.at(self.registers, index, rank)
+
+    def merge(self, other):
+        np.maximum(self.registers, other.registers, out=self.registers)
+
+    def estimate(self):
+        m = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        raw = alpha * m * m / np.sum(np.power(2.0, -self.registers.astype(np.float64)))
+        zeros = int(np.count_nonzero(self.registers == 0))
+        if raw <= 2.5 * m and zeros:
+            # small cardinalities: linear counting is more accurate
+            return int(round(m * np.log(m / zeros)))
+        return int(round(raw))
+
+
+class ColumnProfile:
+    """
+    Partial statistics of a column, computed on chunks and merged.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.nulls = 0
+        self.min = None
+        self.max = None
+        self.sketch = HyperLogLog()
+        self.top = {}
+
+    def update(self, series):
+        self.count += len(series)
+        values = series.dropna()
+        self.nulls += len(series) - len(values)
+        if values.empty:
+            return
+
+        self.sketch.add_hashes(pd.util.hash_pandas_object(values, index=False).values)
+        try:
+            low, high = values.min(), values.max()
+        except TypeError:
+            # mixed types, compare their text
+            low, high = values.astype(str).min(), values.astype(str).max()
+        self.min = _bound(min, self.min, low)
+        self.max = _bound(max, self.max, high)
+        self._add_top(values.value_counts().head(TOP_CANDIDATES).items())
+
+    def _add_top(self, counts):
+        for value, count in counts:
+            self.top[value] = self.top.get(value, 0) + int(count)
+        if len(self.top) > 2 * TOP_CANDIDATES:
+            self.top = dict(sorted(self.top.items(), key=lambda item: item[1], reverse=True)[:TOP_CANDIDATES])
+
+    def merge(self, other):
+        self.count += other.count
+        self.nulls += other.nulls
+        self.sketch.merge(other.sketch)
+        self.min = _bound(min, self.min, other.min)
+        self.max = _bound(max, self.max, other.max)
+        self._add_top(other.top.items())
+
+    def summary(self, top):
+        most_common = sorted(self.top.items(), key=lambda item: item[1], reverse=True)[:top]
+        return {
+            "count": self.count,
+            "nulls": self.nulls,
+            "distinct": min(self.sketch.estimate(), self.count - self.nulls),
+            "min": _plain(self.min),
+            "max": _plain(self.max),
+            "top": [[_plain(value), count] for value, count in most_common],
+        }
+
+
+def _bound(pick, current, value):
+    """
+    Returns pick(current, value), ignoring None and comparing as text values of different types.
+    """
+    if current is None or value is None:
+        return value if current is None else current
+    try:
+        return pick(current, value)
+    except TypeError:
+        return pick(str(current), str(value))
+
+
+def _plain(value):
+    """
+    Converts numpy scalars to JSON serializable values.
+    """
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, bytes):
+        return value.decode("ISO-8859-1")
+    return value
+
+
+def profile_chunk(chunk):
+    """
+    Computes the partial profile of every column of a chunk, run in a worker process.
+    @param chunk: DataFrame
+    @return: dict of column -> ColumnProfile
+    """
+    profiles = {}
+    for column in chunk.columns:
+        profiles[column] = ColumnProfile()
+        profiles[column].update(chunk[column])
+    return profiles
+
+
+def read_chunks(path, columns=None, chunk_rows=CHUNK_ROWS, **read_options):
+    """
+    Reads a csv or sas7bdat file chunk by chunk, keeping only the given columns.
+    csv columns are pruned while parsing, sas7bdat files are pruned chunk by chunk.
+    """
+    if path.endswith(".sas7bdat"):
+        reader = pd.read_sas(path, "sas7bdat", chunksize=chunk_rows, **read_options)
+        for chunk in reader:
+            yield chunk[columns] if columns else chunk
+    else:
+        yield from pd.read_csv(path, usecols=columns, chunksize=chunk_rows, **read_options)
+
+
+def _fingerprint(path, columns, top, read_options):
+    stat = os.stat(path)
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "columns": columns, "top": top,
+            "read_options": {key: str(value) for key, value in sorted(read_options.items())}}
+
+
+def _cache_path(path, fingerprint):
+    # one cache file per set of arguments, so profiles of different columns of a file do not evict each other
+    arguments = {key: fingerprint[key] for key in ("columns", "top", "read_options")}
+    key = hashlib.md5(json.dumps(arguments, sort_keys=True).encode("utf-8")).hexdigest()[:8]
+    return "{}.{}{}".format(path, key, PROFILE_SUFFIX)
+
+
+def _executor(workers):
+    # worker processes are forked: this module is used from a notebook-style script without a
+    # __main__ guard, which spawned workers would run again; threads are used where fork is unavailable
+    if "fork" in multiprocessing.get_all_start_methods():
+        return ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("fork"))
+    return ThreadPoolExecutor(max_workers=workers)
+
+
+def profile(path, columns=None, workers=None, top=10, chunk_rows=CHUNK_ROWS, refresh=False, on_chunk=None,
+            **read_options):
+    """
+    Profiles a data file in one streaming pass: row count, nulls, approximate distinct count, min, max
+    and most frequent values of every column. Chunks are profiled in parallel by worker processes and
+    at most 2 chunks per worker are in memory. The profile is cached next to the file, as
+    <file>.<arguments hash>.profile.json, and reused as long as the file and the arguments are unchanged.
+    on_chunk lets the caller use the same pass, e.g. to keep the rows it needs instead of reading the file again.
+    @param path: csv or sas7bdat file
+    @param columns: columns to profile, all of them if None
+    @param workers: number of worker processes, the number of CPUs by default
+    @param top: number of most frequent values reported per column
+    @param chunk_rows: rows per chunk
+    @param refresh: ignore the cached profile
+    @param on_chunk: function called with every chunk read, in file order; the file is always read when it is set
+    @param read_options: options of pd.read_csv / pd.read_sas, e.g. delimiter or encoding
+    @return: dict of column -> statistics
+    """
+    columns = list(columns) if columns else None
+    fingerprint = _fingerprint(path, columns, top, read_options)
+    cache_path = _cache_path(path, fingerprint)
+    if not refresh and on_chunk is None and os.path.exists(cache_path):
+        with open(cache_path) as f:
+            cached = json.load(f)
+        if cached.get("fingerprint") == fingerprint:
+            return cached["columns"]
+
+    workers = workers or os.cpu_count() or 1
+    profiles = {}
+    with _executor(workers) as executor:
+        max_pending = 2 * workers
+        pending = []
+        for chunk in read_chunks(path, columns, chunk_rows, **read_options):
+            if on_chunk is not None:
+                on_chunk(chunk)
+            pending.append(executor.submit(profile_chunk, chunk))
+            if len(pending) >= max_pending:
+                _merge(profiles, pending.pop(0).result())
+        for future in pending:
+            _merge(profiles, future.result())
+
+    # same values as when read back from the cache, e.g. timestamps as text
+    result = json.loads(json.dumps({column: profiles[column].summary(top) for column in profiles}, default=str))
+    try:
+        with open(cache_path, "w") as f:
+            json.dump({"fingerprint": fingerprint, "columns": result}, f, indent=2)
+    except OSError as e:
+        print(f"Profile of {path} not cached: {e}")
+    return result
+
+
+def _merge(profiles, partial):
+    for column, column_profile in partial.items():
+        if column in profiles:
+            profiles[column].merge(column_profile)
+        else:
+            profiles[column] = column_profile
+
+
+def to_frame(result, top=None):
+    """
+    Returns a profile as a DataFrame with one row per column, for display.
+    @param top: number of most frequent values shown per column, all those of the profile if None
+    """
+    df = pd.DataFrame.from_dict(result, orient="index")
+    if top is not None and "top" in df:
+        df["top"] = df["top"].map(lambda values: values[:top])
+    return df
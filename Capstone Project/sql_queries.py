@@ -1,6 +1,6 @@
 create_airports = """
-CREATE TABLE IF NOT EXISTS public.airports (
-    iata_code    VARCHAR PRIMARY KEY,
+CREATE TABLE IF NOT EXISTS airports (
+    iata_code    VARCHAR,
     name         VARCHAR,
     type         VARCHAR,
     local_code   VARCHAR,
@@ -22,7 +22,7 @@ INSERT INTO airports (iata_code, name, type, local_code, coordinates, city, elev
     iso_country, iso_region, municipality, gps_code) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)"""
 
 create_demographics = """
-CREATE TABLE IF NOT EXISTS public.demographics (
+CREATE TABLE IF NOT EXISTS demographics (
     city                   VARCHAR,
     state                  VARCHAR,
     media_age              FLOAT,
@@ -46,8 +46,8 @@ num_veterans, foreign_born, average_household_size, state_code, race, count) VAL
 %s, %s, %s, %s, %s, %s, %s, %s)"""
 
 create_immigrations = """
-CREATE TABLE IF NOT EXISTS public.immigrations (
-    cicid    FLOAT PRIMARY KEY,
+CREATE TABLE IF NOT EXISTS immigrations (
+    cicid    FLOAT,
     year     FLOAT,
     month    FLOAT,
     cit      FLOAT,
@@ -97,7 +97,100 @@ temperature_insert = ("""
 INSERT INTO temperature (timestamp, average_temperature, average_temperature_uncertainty, city, country, \
 latitude, longitude) VALUES (%s, %s, %s, %s, %s, %s, %s)""")
 
-drop_temperature = "DROP TABLE IF EXISTS weather;"
+drop_temperature = "DROP TABLE IF EXISTS temperature;"
 
-drop_table_queries = [drop_airports, drop_demographics, drop_immigrations, drop_temperature]
-create_table_queries = [create_airports, create_demographics, create_immigrations, create_temperature]
\ No newline at end of file
+# City dimension of the analytical model, one row per city of the demographics data
+create_cities = """
+CREATE TABLE IF NOT EXISTS cities (
+    city_id                INT,
+    state_code             VARCHAR(2),
+    city                   VARCHAR,
+    median_age             FLOAT,
+    total_population       INT,
+    foreign_born           INT,
+    average_household_size FLOAT
+);
+"""
+
+drop_cities = "DROP TABLE IF EXISTS cities;"
+
+city_copy = """
+COPY cities (city_id, state_code, city, median_age, total_population, foreign_born, average_household_size) \
+FROM STDIN WITH CSV"""
+
+# Analytical fact table: one narrow row per arrival, with the port -> city -> demographics and
+# arrival month -> temperature joins already resolved. Partitioned by arrival month (YYYYMM).
+create_arrivals = """
+CREATE TABLE IF NOT EXISTS arrivals (
+    cicid           BIGINT,
+    arrival_month   INT NOT NULL,
+    arrival_date    DATE,
+    city_id         INT,
+    visa            SMALLINT,
+    mode            SMALLINT,
+    age             SMALLINT,
+    gender          CHAR(1),
+    avg_temperature REAL
+) PARTITION BY LIST (arrival_month);
+"""
+
+drop_arrivals = "DROP TABLE IF EXISTS arrivals;"
+
+arrivals_partition_create = """
+CREATE TABLE IF NOT EXISTS arrivals_{month} PARTITION OF arrivals FOR VALUES IN ({month});"""
+
+arrivals_copy = """
+COPY arrivals (cicid, arrival_month, arrival_date, city_id, visa, mode, age, gender, avg_temperature) \
+FROM STDIN WITH CSV"""
+
+# Primary keys are added once the tables are loaded, so the bulk inserts do not maintain them row by row
+create_airports_pkey = "ALTER TABLE airports ADD CONSTRAINT airports_pkey PRIMARY KEY (iata_code);"
+drop_airports_pkey = "ALTER TABLE airports DROP CONSTRAINT IF EXISTS airports_pkey;"
+
+create_immigrations_pkey = "ALTER TABLE immigrations ADD CONSTRAINT immigrations_pkey PRIMARY KEY (cicid);"
+drop_immigrations_pkey = "ALTER TABLE immigrations DROP CONSTRAINT IF EXISTS immigrations_pkey;"
+
+create_cities_pkey = "ALTER TABLE cities ADD CONSTRAINT cities_pkey PRIMARY KEY (city_id);"
+drop_cities_pkey = "ALTER TABLE cities DROP CONSTRAINT IF EXISTS cities_pkey;"
+
+# Lookups of the analytical queries
+temperature_select = """
+SELECT average_temperature FROM temperature WHERE city = %s AND timestamp = %s"""
+
+demographics_select = """
+SELECT * FROM demographics WHERE city = %s AND state_code = %s"""
+
+immigrations_by_port_select = """
+SELECT COUNT(*) FROM immigrations WHERE iata = %s AND arrdate BETWEEN %s AND %s"""
+
+arrivals_by_city_select = """
+SELECT COUNT(*), AVG(avg_temperature) FROM arrivals WHERE arrival_month = %s AND city_id = %s"""
+
+# Indexes needed by each lookup, built after the bulk load
+index_catalog = {
+    "temperature_select": [
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS temperature_city_timestamp_idx ON temperature (city, timestamp);"],
+    "demographics_select": [
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS demographics_city_state_idx ON demographics (city, state_code);"],
+    "immigrations_by_port_select": [
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS immigrations_iata_arrdate_idx ON immigrations (iata, arrdate);"],
+    # indexes of a partitioned table cannot be built concurrently, they are created on every partition
+    "arrivals_by_city_select": [
+        "CREATE INDEX IF NOT EXISTS arrivals_city_idx ON arrivals (city_id);"],
+}
+
+# Queries that must not scan a large table, with sample parameters
+plan_checks = {
+    "temperature_select": (temperature_select, ("Chicago", "2013-08-01")),
+    "demographics_select": (demographics_select, ("Chicago", "IL")),
+    "immigrations_by_port_select": (immigrations_by_port_select, ("CHI", 20545.0, 20574.0)),
+    "arrivals_by_city_select": (arrivals_by_city_select, (201604, 1)),
+}
+
+table_names = ["airports", "demographics", "immigrations", "temperature", "cities", "arrivals"]
+drop_table_queries = [drop_airports, drop_demographics, drop_immigrations, drop_temperature, drop_cities,
+                      drop_arrivals]
+create_table_queries = [create_airports, create_demographics, create_immigrations, create_temperature,
+                        create_cities, create_arrivals]
+create_constraint_queries = [create_airports_pkey, create_immigrations_pkey, create_cities_pkey]
+drop_constraint_queries = [drop_airports_pkey, drop_immigrations_pkey, drop_cities_pkey]
@@ -7,7 +7,7 @@ CREATE TABLE public.artists (
 );
 
 CREATE TABLE public.songplays (
-	playid varchar(32) NOT NULL,
+	playid int8 NOT NULL,
 	start_time timestamp NOT NULL,
 	userid int4 NOT NULL,
 	"level" varchar(256),
@@ -82,6 +82,24 @@ CREATE TABLE public.users (
 	CONSTRAINT users_pkey PRIMARY KEY (userid)
 );
 
+CREATE TABLE public.songplays_hourly (
+	start_hour timestamp NOT NULL,
+	"level" varchar(256),
+	artistid varchar(256),
+	plays int8,
+	users int8
+)
+SORTKEY (start_hour);
+
+CREATE TABLE public.songplays_daily (
+	start_day timestamp NOT NULL,
+	"level" varchar(256),
+	artistid varchar(256),
+	plays int8,
+	users int8
+)
+SORTKEY (start_day);
+
 
 
 
@@ -2,7 +2,7 @@ from datetime import datetime, timedelta
 import os
 from airflow import DAG
 from airflow.operators.dummy_operator import DummyOperator
-from airflow.operators import (StageToRedshiftOperator, LoadFactOperator,
+from airflow.operators import (StageToRedshiftOperator, LoadFactOperator, LoadRollupOperator,
                                 LoadDimensionOperator, DataQualityOperator)
 from helpers import SqlQueries
 
@@ -59,6 +59,26 @@ load_songplays_table = LoadFactOperator(
     sql_stmt=SqlQueries.songplay_table_insert
 )
 
+load_songplays_hourly_rollup = LoadRollupOperator(
+    task_id='Load_songplays_hourly_rollup',
+    dag=dag,
+    redshift_conn_id="redshift",
+    table='songplays_hourly',
+    bucket_column='start_hour',
+    window_stmt=SqlQueries.songplays_window,
+    sql_stmt=SqlQueries.songplays_hourly_rollup
+)
+
+load_songplays_daily_rollup = LoadRollupOperator(
+    task_id='Load_songplays_daily_rollup',
+    dag=dag,
+    redshift_conn_id="redshift",
+    table='songplays_daily',
+    bucket_column='start_day',
+    window_stmt=SqlQueries.songplays_window,
+    sql_stmt=SqlQueries.songplays_daily_rollup
+)
+
 load_user_dimension_table = LoadDimensionOperator(
     task_id='Load_user_dim_table',
     dag=dag,
@@ -100,7 +120,7 @@ run_quality_checks = DataQualityOperator(
     task_id='Run_data_quality_checks',
     dag=dag,
     redshift_conn_id="redshift",
-    tables=['songplays', 'users', 'songs', 'artists', 'time']
+    tables=['songplays', 'users', 'songs', 'artists', 'time', 'songplays_hourly', 'songplays_daily']
 )
 
 end_operator = DummyOperator(task_id='Stop_execution',  dag=dag)
@@ -115,10 +135,14 @@ load_songplays_table >> load_user_dimension_table
 load_songplays_table >> load_song_dimension_table
 load_songplays_table >> load_artist_dimension_table
 load_songplays_table >> load_time_dimension_table
+load_songplays_table >> load_songplays_hourly_rollup
+load_songplays_table >> load_songplays_daily_rollup
 
 load_user_dimension_table >> run_quality_checks
 load_song_dimension_table >> run_quality_checks
 load_artist_dimension_table >> run_quality_checks
 load_time_dimension_table >> run_quality_checks
+load_songplays_hourly_rollup >> run_quality_checks
+load_songplays_daily_rollup >> run_quality_checks
 
 run_quality_checks >> end_operator
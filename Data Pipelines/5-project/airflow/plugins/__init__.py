@@ -11,6 +11,7 @@ class UdacityPlugin(AirflowPlugin):
     operators = [
         operators.StageToRedshiftOperator,
         operators.LoadFactOperator,
+        operators.LoadRollupOperator,
         operators.LoadDimensionOperator,
         operators.DataQualityOperator
     ]
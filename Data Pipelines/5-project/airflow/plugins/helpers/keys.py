@@ -0,0 +1,24 @@
+"""
+Redshift expression of the deterministic surrogate keys of common/keys.py.
+
+The plugins are deployed on their own into $AIRFLOW_HOME/plugins, where the repository's common package is
+not importable, so the expression is shipped with them. `python -m common.keys` checks from the repository
+that it is the same expression as `common.keys.sql_surrogate_key`.
+"""
+
+# Natural key columns are joined with this separator before hashing
+KEY_SEPARATOR = '|'
+
+# 15 hex digits of the md5 digest = 60 bits, always fits a signed BIGINT
+KEY_HEX_DIGITS = 15
+
+
+def sql_surrogate_key(*columns):
+    """
+    Returns a Redshift expression computing the surrogate key of the given natural key columns.
+    @param columns: natural key column expressions, in a fixed order
+    @return: SQL expression of type BIGINT
+    """
+    concat = " || '{}' || ".format(KEY_SEPARATOR).join(
+        "COALESCE(CAST({} AS VARCHAR), '')".format(column) for column in columns)
+    return "STRTOL(LEFT(MD5({}), {}), 16)".format(concat, KEY_HEX_DIGITS)
@@ -1,7 +1,10 @@
+from helpers.keys import sql_surrogate_key
+
+
 class SqlQueries:
     songplay_table_insert = ("""
         SELECT
-                md5(events.sessionid || events.start_time) songplay_id,
+                {songplay_id} songplay_id,
                 events.start_time, 
                 events.userid, 
                 events.level, 
@@ -17,7 +20,7 @@ class SqlQueries:
             ON events.song = songs.title
                 AND events.artist = songs.artist_name
                 AND events.length = songs.duration
-    """)
+    """).format(songplay_id=sql_surrogate_key('events.userid', 'events.sessionid', 'events.ts'))
 
     user_table_insert = ("""
         SELECT distinct userid, firstname, lastname, gender, level
@@ -39,4 +42,42 @@ class SqlQueries:
         SELECT start_time, extract(hour from start_time), extract(day from start_time), extract(week from start_time), 
                extract(month from start_time), extract(year from start_time), extract(dayofweek from start_time)
         FROM songplays
-    """)
\ No newline at end of file
+    """)
+
+    # Days touched by the events of the latest staging load, the only ones the rollups recompute
+    songplays_window = ("""
+        SELECT DATE_TRUNC('day', MIN(TIMESTAMP 'epoch' + ts/1000 * interval '1 second')),
+               DATE_TRUNC('day', MAX(TIMESTAMP 'epoch' + ts/1000 * interval '1 second')) + interval '1 day'
+        FROM staging_events
+        WHERE page='NextSong'
+    """)
+
+    songplays_hourly_rollup = ("""
+        SELECT DATE_TRUNC('hour', start_time), level, artistid, COUNT(*), COUNT(DISTINCT userid)
+        FROM songplays
+        WHERE start_time >= '{start}' AND start_time < '{end}'
+        GROUP BY 1, 2, 3
+    """)
+
+    songplays_daily_rollup = ("""
+        SELECT DATE_TRUNC('day', start_time), level, artistid, COUNT(*), COUNT(DISTINCT userid)
+        FROM songplays
+        WHERE start_time >= '{start}' AND start_time < '{end}'
+        GROUP BY 1, 2, 3
+    """)
+
+    # Dashboard queries, served by the rollups instead of the songplays fact table
+    plays_per_hour_by_level = ("""
+        SELECT start_hour, level, SUM(plays) AS plays
+        FROM songplays_hourly
+        GROUP BY start_hour, level
+        ORDER BY start_hour, level
+    """)
+
+    top_artists_per_day = ("""
+        SELECT r.start_day, a.name, SUM(r.plays) AS plays
+        FROM songplays_daily r
+        JOIN artists a ON a.artistid = r.artistid
+        GROUP BY r.start_day, a.name
+        ORDER BY r.start_day, plays DESC
+    """)
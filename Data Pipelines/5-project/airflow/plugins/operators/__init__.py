@@ -1,11 +1,13 @@
 from operators.stage_redshift import StageToRedshiftOperator
 from operators.load_fact import LoadFactOperator
+from operators.load_rollup import LoadRollupOperator
 from operators.load_dimension import LoadDimensionOperator
 from operators.data_quality import DataQualityOperator
 
 __all__ = [
     'StageToRedshiftOperator',
     'LoadFactOperator',
+    'LoadRollupOperator',
     'LoadDimensionOperator',
     'DataQualityOperator'
 ]
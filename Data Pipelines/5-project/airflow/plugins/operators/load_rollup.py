@@ -0,0 +1,40 @@
+from airflow.hooks.postgres_hook import PostgresHook
+from airflow.models import BaseOperator
+from airflow.utils.decorators import apply_defaults
+
+class LoadRollupOperator(BaseOperator):
+
+    ui_color = '#F9C66B'
+
+    @apply_defaults
+    def __init__(self,
+                 redshift_conn_id="",
+                 table="",
+                 bucket_column="",
+                 window_stmt="",
+                 sql_stmt="",
+                 *args, **kwargs):
+
+        super(LoadRollupOperator, self).__init__(*args, **kwargs)
+        self.redshift_conn_id = redshift_conn_id
+        self.table = table
+        self.bucket_column = bucket_column
+        self.window_stmt = window_stmt
+        self.sql_stmt = sql_stmt
+
+    def execute(self, context):
+        redshift = PostgresHook(postgres_conn_id=self.redshift_conn_id)
+
+        start, end = redshift.get_first(self.window_stmt)
+        if start is None:
+            self.log.info(f"No new events, {self.table} is up to date")
+            return
+
+        self.log.info(f"Refreshing rollup table {self.table} from {start} to {end}")
+        delete_statement = f"DELETE FROM {self.table} " \
+                           f"WHERE {self.bucket_column} >= '{start}' AND {self.bucket_column} < '{end}'"
+        insert_statement = f"INSERT INTO {self.table} \n{self.sql_stmt.format(start=start, end=end)}"
+        self.log.info(f"Running sql: \n{delete_statement}\n{insert_statement}")
+        # both statements run in one transaction, readers never see a half refreshed window
+        redshift.run([delete_statement, insert_statement])
+        self.log.info(f"Successfully refreshed {self.table}")
@@ -0,0 +1,86 @@
+import os
+
+import boto3
+from moto import mock_aws
+
+import provision
+
+
+# Runs the provisioning steps of provision.py against moto's in-memory AWS, no AWS account needed:
+# IAM role, security group ingress, cluster creation and wait_for_cluster, then the whole provisioning again
+# to check that a re-run on an existing environment succeeds.
+# Needs moto: pip install "moto[iam,ec2,redshift]". Usage: python check_provision.py
+
+REGION = 'us-west-2'
+
+SETTINGS = provision.ClusterSettings(
+    cluster_type='multi-node', num_nodes=2, node_type='dc2.large', identifier='dwhcluster', db='dwh',
+    db_user='dwhuser', db_password='Passw0rd', port=5439, iam_role_name='dwhRole')
+
+
+class SlowCluster:
+    '''
+    Redshift client reporting the cluster as 'creating' for the first polls, as AWS does for several minutes
+    '''
+
+    def __init__(self, redshift, polls_creating):
+        self.redshift = redshift
+        self.polls_creating = polls_creating
+
+    def describe_clusters(self, **kwargs):
+        response = self.redshift.describe_clusters(**kwargs)
+        if self.polls_creating > 0:
+            self.polls_creating -= 1
+            props = dict(response['Clusters'][0], ClusterStatus='creating')
+            props.pop('Endpoint', None)
+            response = dict(response, Clusters=[props])
+        return response
+
+
+def check():
+    '''
+    Runs every step and asserts on the resulting AWS resources
+    '''
+    for name in ('AWS_ACCESS_KEY_ID', 'AWS_SECRET_ACCESS_KEY'):
+        os.environ.setdefault(name, 'testing')
+    # the role gets the AWS managed AmazonS3ReadOnlyAccess policy, which moto only knows when asked to load them
+    os.environ['MOTO_IAM_LOAD_MANAGED_POLICIES'] = 'true'
+
+    with mock_aws():
+        iam = boto3.client('iam', region_name=REGION)
+        ec2 = boto3.client('ec2', region_name=REGION)
+        redshift = boto3.client('redshift', region_name=REGION)
+
+        role_arn = provision.create_iam_role(iam, SETTINGS.iam_role_name)
+        assert role_arn.endswith(':role/' + SETTINGS.iam_role_name), role_arn
+        policies = iam.list_attached_role_policies(RoleName=SETTINGS.iam_role_name)['AttachedPolicies']
+        assert [p['PolicyArn'] for p in policies] == [provision.S3_READ_POLICY_ARN], policies
+
+        group_id = provision.open_port(ec2, SETTINGS.port)
+        permissions = ec2.describe_security_groups(GroupIds=[group_id])['SecurityGroups'][0]['IpPermissions']
+        assert any(p.get('FromPort') == SETTINGS.port and p.get('ToPort') == SETTINGS.port for p in permissions), permissions
+
+        provision.create_cluster(redshift, SETTINGS, role_arn, group_id)
+        delays = []
+        props = provision.wait_for_cluster(SlowCluster(redshift, 3), SETTINGS.identifier, sleep=delays.append)
+        assert delays == [5, 10, 20], delays
+        assert props['ClusterStatus'] == 'available' and props['Endpoint']['Address'], props
+        assert props['IamRoles'][0]['IamRoleArn'] == role_arn, props['IamRoles']
+
+        try:
+            provision.wait_for_cluster(SlowCluster(redshift, 100), SETTINGS.identifier, timeout=30, sleep=delays.append)
+            raise AssertionError('wait_for_cluster did not time out')
+        except TimeoutError:
+            pass
+
+        # every step is idempotent: provisioning again finds the role, the rule and the cluster in place
+        props, second_role_arn = provision.provision(iam, ec2, redshift, SETTINGS)
+        assert second_role_arn == role_arn
+        assert len(redshift.describe_clusters()['Clusters']) == 1
+
+    print('Provisioning checked against moto: role {}, security group {}, endpoint {}'.format(
+        role_arn, group_id, props['Endpoint']['Address']))
+
+
+if __name__ == "__main__":
+    check()
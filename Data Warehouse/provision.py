@@ -0,0 +1,237 @@
+import argparse
+import configparser
+import json
+import os
+import sys
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+import boto3
+import psycopg2
+from botocore.exceptions import ClientError
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+from common import profiling
+
+
+# Provisions the Redshift cluster of the project and creates its tables:
+#   1. the IAM role and the security group ingress rule are set up concurrently, they do not depend on each other
+#   2. the cluster is created with both as soon as they are ready
+#   3. describe_clusters is polled with exponential backoff until the cluster is available with an endpoint
+#   4. the create_table DDL runs right away
+# Every step is idempotent, so a nightly run can be repeated on an existing environment. AWS is only reached
+# through the boto3 clients passed in: with --endpoint-url the whole flow runs against a local stand-in such
+# as moto_server or LocalStack.
+
+S3_READ_POLICY_ARN = "arn:aws:iam::aws:policy/AmazonS3ReadOnlyAccess"
+
+ASSUME_ROLE_POLICY = {
+    'Statement': [{'Action': 'sts:AssumeRole',
+                   'Effect': 'Allow',
+                   'Principal': {'Service': 'redshift.amazonaws.com'}}],
+    'Version': '2012-10-17'}
+
+# Cluster states from which the cluster never becomes available on its own
+FAILED_STATUSES = ('deleting', 'final-snapshot', 'hardware-failure', 'incompatible-hsm', 'incompatible-network',
+                   'incompatible-parameters', 'incompatible-restore', 'storage-full')
+
+# Settings of the [DWH] section of dwh.cfg
+ClusterSettings = namedtuple('ClusterSettings', [
+    'cluster_type', 'num_nodes', 'node_type', 'identifier', 'db', 'db_user', 'db_password', 'port', 'iam_role_name'])
+
+
+def read_settings(config):
+    '''
+    Reads the cluster settings from the [DWH] section of dwh.cfg
+    '''
+    return ClusterSettings(
+        cluster_type=config.get("DWH", "DWH_CLUSTER_TYPE"),
+        num_nodes=int(config.get("DWH", "DWH_NUM_NODES")),
+        node_type=config.get("DWH", "DWH_NODE_TYPE"),
+        identifier=config.get("DWH", "DWH_CLUSTER_IDENTIFIER"),
+        db=config.get("DWH", "DWH_DB"),
+        db_user=config.get("DWH", "DWH_DB_USER"),
+        db_password=config.get("DWH", "DWH_DB_PASSWORD"),
+        port=int(config.get("DWH", "DWH_PORT")),
+        iam_role_name=config.get("DWH", "DWH_IAM_ROLE_NAME"))
+
+
+def _error_code(error):
+    return error.response.get('Error', {}).get('Code')
+
+
+def create_iam_role(iam, role_name):
+    '''
+    Creates the IAM role allowing Redshift to read S3, or reuses it if it exists, and returns its ARN
+    '''
+    try:
+        iam.create_role(
+            Path='/',
+            RoleName=role_name,
+            Description="Allows Redshift clusters to call AWS services on your behalf.",
+            AssumeRolePolicyDocument=json.dumps(ASSUME_ROLE_POLICY))
+    except ClientError as e:
+        if _error_code(e) != 'EntityAlreadyExists':
+            raise
+    iam.attach_role_policy(RoleName=role_name, PolicyArn=S3_READ_POLICY_ARN)
+    return iam.get_role(RoleName=role_name)['Role']['Arn']
+
+
+def open_port(ec2, port, cidr='0.0.0.0/0'):
+    '''
+    Allows connections to port on the default security group of the default VPC, and returns the group id
+    '''
+    vpcs = ec2.describe_vpcs(Filters=[{'Name': 'isDefault', 'Values': ['true']}])['Vpcs']
+    if not vpcs:
+        raise RuntimeError("No default VPC in this region")
+    groups = ec2.describe_security_groups(Filters=[{'Name': 'vpc-id', 'Values': [vpcs[0]['VpcId']]},
+                                                   {'Name': 'group-name', 'Values': ['default']}])['SecurityGroups']
+    group_id = groups[0]['GroupId']
+    try:
+        ec2.authorize_security_group_ingress(
+            GroupId=group_id,
+            IpPermissions=[{'IpProtocol': 'tcp', 'FromPort': port, 'ToPort': port, 'IpRanges': [{'CidrIp': cidr}]}])
+    except ClientError as e:
+        if _error_code(e) != 'InvalidPermission.Duplicate':
+            raise
+    return group_id
+
+
+def create_cluster(redshift, settings, role_arn, security_group_id):
+    '''
+    Starts the creation of the Redshift cluster, unless a cluster with the same identifier exists
+    '''
+    options = dict(
+        NodeType=settings.node_type,
+        ClusterType=settings.cluster_type,
+        DBName=settings.db,
+        ClusterIdentifier=settings.identifier,
+        MasterUsername=settings.db_user,
+        MasterUserPassword=settings.db_password,
+        Port=settings.port,
+        VpcSecurityGroupIds=[security_group_id],
+        IamRoles=[role_arn])
+    if settings.cluster_type == 'multi-node':
+        options['NumberOfNodes'] = settings.num_nodes
+    try:
+        redshift.create_cluster(**options)
+    except ClientError as e:
+        if _error_code(e) != 'ClusterAlreadyExists':
+            raise
+        print("Cluster {} already exists".format(settings.identifier))
+
+
+def wait_for_cluster(redshift, identifier, timeout=1800, initial_delay=5, max_delay=60, backoff=2,
+                     sleep=time.sleep, clock=time.monotonic):
+    '''
+    Polls the cluster until it is available with an endpoint, waiting initial_delay seconds after the first
+    poll and multiplying the delay by backoff after each one, up to max_delay.
+    Raises RuntimeError if the cluster ends up in a failed state and TimeoutError after timeout seconds.
+    Returns the cluster properties.
+    '''
+    deadline = clock() + timeout
+    delay = initial_delay
+    while True:
+        props = redshift.describe_clusters(ClusterIdentifier=identifier)['Clusters'][0]
+        status = props['ClusterStatus']
+        if status == 'available' and props.get('Endpoint', {}).get('Address'):
+            return props
+        if status in FAILED_STATUSES:
+            raise RuntimeError("Cluster {} is {}".format(identifier, status))
+        if clock() + delay > deadline:
+            raise TimeoutError("Cluster {} still {} after {}s".format(identifier, status, timeout))
+        print("Cluster {} is {}, next check in {}s".format(identifier, status, delay))
+        sleep(delay)
+        delay = min(max_delay, delay * backoff)
+
+
+def run_ddl(connect, queries):
+    '''
+    Runs the DDL statements on a new connection, committing each of them
+    '''
+    conn = connect()
+    try:
+        cur = conn.cursor()
+        for query in queries:
+            cur.execute(query)
+            conn.commit()
+    finally:
+        conn.close()
+
+
+def provision(iam, ec2, redshift, settings, connect=None, ddl_queries=(), wait_options=None):
+    '''
+    Provisions the whole environment and creates the tables.
+    connect is a function (cluster properties) -> DB-API connection, the DDL is skipped if it is None.
+    Returns the cluster properties and the role ARN.
+    '''
+    start = time.monotonic()
+
+    with profiling.stage('iam_role_and_ingress'):
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            role = executor.submit(create_iam_role, iam, settings.iam_role_name)
+            ingress = executor.submit(open_port, ec2, settings.port)
+            role_arn, security_group_id = role.result(), ingress.result()
+    print("IAM role {} and security group {} ready after {:.1f}s".format(role_arn, security_group_id, time.monotonic() - start))
+
+    with profiling.stage('create_cluster'):
+        create_cluster(redshift, settings, role_arn, security_group_id)
+
+    with profiling.stage('wait_for_cluster'):
+        props = wait_for_cluster(redshift, settings.identifier, **(wait_options or {}))
+    print("Cluster available at {} after {:.1f}s".format(props['Endpoint']['Address'], time.monotonic() - start))
+
+    if connect is not None and ddl_queries:
+        with profiling.stage('create_tables'):
+            run_ddl(lambda: connect(props), ddl_queries)
+        print("Tables created after {:.1f}s".format(time.monotonic() - start))
+
+    return props, role_arn
+
+
+def main():
+    '''
+    Provisions the Redshift cluster described in dwh.cfg, creates the tables and writes the cluster endpoint
+    and role ARN back to dwh.cfg for create_tables.py and etl.py
+    Usage: python provision.py [--config dwh.cfg] [--region us-west-2] [--endpoint-url URL] [--skip-ddl]
+    '''
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--config", default="dwh.cfg")
+    parser.add_argument("--region", default="us-west-2")
+    parser.add_argument("--endpoint-url", help="AWS stand-in, e.g. http://localhost:5000 for moto_server")
+    parser.add_argument("--skip-ddl", action="store_true", help="do not create the tables")
+    args = parser.parse_args()
+
+    config = configparser.ConfigParser()
+    config.read(args.config)
+    settings = read_settings(config)
+
+    credentials = dict(region_name=args.region, endpoint_url=args.endpoint_url,
+                       aws_access_key_id=config.get('AWS', 'KEY'), aws_secret_access_key=config.get('AWS', 'SECRET'))
+    iam = boto3.client('iam', **credentials)
+    ec2 = boto3.client('ec2', **credentials)
+    redshift = boto3.client('redshift', **credentials)
+
+    def connect(props):
+        return psycopg2.connect(host=props['Endpoint']['Address'], port=props['Endpoint']['Port'],
+                                dbname=settings.db, user=settings.db_user, password=settings.db_password)
+
+    ddl_queries = []
+    if not args.skip_ddl:
+        from sql_queries import create_table_queries, drop_table_queries
+        ddl_queries = drop_table_queries + create_table_queries
+
+    profiling.start('provision_cluster')
+    props, role_arn = provision(iam, ec2, redshift, settings, connect, ddl_queries)
+    profiling.finish()
+
+    config.set('CLUSTER', 'HOST', props['Endpoint']['Address'])
+    config.set('IAM_ROLE', 'ARN', role_arn)
+    with open(args.config, 'w') as f:
+        config.write(f)
+    print("{} updated with the cluster endpoint and role ARN".format(args.config))
+
+
+if __name__ == "__main__":
+    main()
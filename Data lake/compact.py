@@ -0,0 +1,150 @@
+import math
+import sys
+
+from pyspark.sql import SparkSession
+
+
+TARGET_FILE_BYTES = 128 * 1024 * 1024
+
+
+def hadoop_path(spark, path):
+    """
+        Description: Returns the Hadoop FileSystem and Path objects for a local, hdfs or s3a location
+    """
+    jvm = spark.sparkContext._jvm
+    hadoop_conf = spark.sparkContext._jsc.hadoopConfiguration()
+    hpath = jvm.org.apache.hadoop.fs.Path(path)
+    return hpath.getFileSystem(hadoop_conf), hpath
+
+
+def count_files(spark, path):
+    """
+        Description: Counts the parquet data files and their total size under a table directory
+
+        Parameters:
+            spark : Spark Session
+            path  : root directory of the parquet table
+
+        Returns:
+            (number of parquet files, total bytes); (0, 0) if the path does not exist
+    """
+    fs, hpath = hadoop_path(spark, path)
+    if not fs.exists(hpath):
+        return 0, 0
+
+    num_files, num_bytes = 0, 0
+    files = fs.listFiles(hpath, True)
+    while files.hasNext():
+        status = files.next()
+        if status.getPath().getName().endswith('.parquet'):
+            num_files += 1
+            num_bytes += status.getLen()
+    return num_files, num_bytes
+
+
+def records_per_file(num_rows, num_bytes, target_file_bytes=TARGET_FILE_BYTES):
+    """
+        Description: Estimates how many rows fit into a file of target_file_bytes, given an observed rows/bytes ratio
+    """
+    if num_rows <= 0 or num_bytes <= 0:
+        return 0
+    bytes_per_row = num_bytes / num_rows
+    return max(1, int(target_file_bytes / bytes_per_row))
+
+
+def write_partitioned(df, path, partition_cols, max_records_per_file=0, num_files=None):
+    """
+        Description: Writes a DataFrame as parquet, overwriting only the partitions present in df.
+        Rows are shuffled by the partition columns first, so each partition directory is written by a
+        single task and ends up with one file (split further only by max_records_per_file).
+
+        Parameters:
+            df                   : DataFrame to write
+            path                 : destination directory
+            partition_cols       : sequence of column names to partition by, may be empty
+            max_records_per_file : upper bound of rows per output file, 0 means unlimited
+            num_files            : number of files for an unpartitioned table, None keeps the current partitioning
+    """
+    partition_cols = list(partition_cols)
+    if partition_cols:
+        df = df.repartition(*partition_cols)
+    elif num_files:
+        df = df.coalesce(num_files)
+
+    writer = df.write.mode('overwrite').option('maxRecordsPerFile', max_records_per_file)
+    if partition_cols:
+        writer = writer.partitionBy(*partition_cols)
+    writer.parquet(path)
+
+
+def compact_partitions(spark, path, partition_cols, target_file_bytes=TARGET_FILE_BYTES):
+    """
+        Description: Rewrites a fragmented parquet table so that every partition holds files close to target_file_bytes.
+        The table is rewritten to a sibling directory and then swapped in place of the original one: the original
+        is renamed to a backup directory, the rewrite renamed to the table path, and the backup only deleted once
+        both renames succeeded. A failed swap restores the original and raises RuntimeError.
+
+        Parameters:
+            spark             : Spark Session
+            path              : root directory of the parquet table
+            partition_cols    : partition columns of the rewritten table (can differ from the current layout)
+            target_file_bytes : desired size of each output file
+
+        Returns:
+            (files before, files after)
+    """
+    path = path.rstrip('/')
+    files_before, bytes_before = count_files(spark, path)
+    if files_before == 0:
+        print('Nothing to compact in {}'.format(path))
+        return 0, 0
+
+    df = spark.read.parquet(path)
+    num_rows = df.count()
+    max_rows = records_per_file(num_rows, bytes_before, target_file_bytes)
+
+    tmp_path = path + '_compacting'
+    num_files = math.ceil(bytes_before / target_file_bytes)
+    write_partitioned(df, tmp_path, partition_cols, max_rows, num_files)
+
+    fs, hpath = hadoop_path(spark, path)
+    _, tmp_hpath = hadoop_path(spark, tmp_path)
+    _, backup_hpath = hadoop_path(spark, path + '_precompaction')
+    if fs.exists(backup_hpath):
+        raise RuntimeError('{} exists, left by an interrupted compaction: restore or remove it first'.format(
+            backup_hpath.toString()))
+
+    # rename returns False instead of raising, and on s3a it is a copy: the original is kept until the end
+    if not fs.rename(hpath, backup_hpath):
+        raise RuntimeError('Could not move {} to {}, the table is unchanged'.format(path, backup_hpath.toString()))
+    if not fs.rename(tmp_hpath, hpath):
+        if fs.exists(hpath):
+            fs.delete(hpath, True)
+        restored = fs.rename(backup_hpath, hpath)
+        raise RuntimeError('Could not move {} to {}, {}'.format(
+            tmp_path, path, 'the original table was restored' if restored else
+            'the original table is in ' + backup_hpath.toString()))
+    fs.delete(backup_hpath, True)
+
+    files_after, _ = count_files(spark, path)
+    print('{}: {} files before compaction, {} files after.'.format(path, files_before, files_after))
+    return files_before, files_after
+
+
+def main():
+    """
+        Compacts an existing parquet table
+        Usage: python compact.py <table path> [partition column ...]
+    """
+    if len(sys.argv) < 2:
+        print(main.__doc__)
+        sys.exit(1)
+
+    spark = SparkSession.builder \
+        .config("spark.jars.packages", "org.apache.hadoop:hadoop-aws:2.7.5") \
+        .getOrCreate()
+    compact_partitions(spark, sys.argv[1], sys.argv[2:])
+
+
+if __name__ == "__main__":
+    main()
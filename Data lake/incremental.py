@@ -0,0 +1,133 @@
+import json
+
+from pyspark.sql import Window
+from pyspark.sql import functions as F
+
+from compact import hadoop_path, write_partitioned
+
+
+def list_input_files(spark, pattern):
+    """
+        Description: Expands a glob pattern (local, hdfs or s3a) into the sorted list of matching files
+    """
+    fs, hpath = hadoop_path(spark, pattern)
+    statuses = fs.globStatus(hpath) or []
+    return sorted(status.getPath().toString() for status in statuses if status.isFile())
+
+
+def empty_watermark():
+    """
+        Description: Returns the watermark of a run that has not processed anything yet
+    """
+    return {'files': [], 'max_ts': None}
+
+
+def load_watermark(spark, path):
+    """
+        Description: Loads the watermark of a previous run, i.e. the input files already processed and the
+        maximum event timestamp seen. Returns an empty watermark if none was recorded yet.
+    """
+    fs, hpath = hadoop_path(spark, path)
+    if not fs.exists(hpath):
+        return empty_watermark()
+    content = spark.read.text(path, wholetext=True).first()[0]
+    return json.loads(content)
+
+
+def save_watermark(spark, path, watermark):
+    """
+        Description: Overwrites the watermark file at path with the given watermark
+    """
+    fs, hpath = hadoop_path(spark, path)
+    stream = fs.create(hpath, True)
+    try:
+        stream.write(bytearray(json.dumps(watermark).encode('utf-8')))
+    finally:
+        stream.close()
+
+
+def pending_files(spark, pattern, watermark):
+    """
+        Description: Returns the files matching pattern that are not recorded in the watermark yet
+
+        Parameters:
+            spark     : Spark Session
+            pattern   : glob pattern of the input files
+            watermark : watermark as returned by load_watermark
+    """
+    processed = set(watermark['files'])
+    all_files = list_input_files(spark, pattern)
+    new_files = [f for f in all_files if f not in processed]
+    print('{} new files out of {} found in {}'.format(len(new_files), len(all_files), pattern))
+    return new_files
+
+
+def advance_watermark(watermark, new_files, max_ts=None):
+    """
+        Description: Returns a new watermark that includes new_files and the latest event timestamp
+    """
+    if watermark['max_ts'] is not None and max_ts is not None:
+        max_ts = max(watermark['max_ts'], max_ts)
+    elif max_ts is None:
+        max_ts = watermark['max_ts']
+    return {'files': watermark['files'] + list(new_files), 'max_ts': max_ts}
+
+
+def latest_rows(df, key_cols, latest_by):
+    """
+        Description: Keeps one row per key_cols, the one with the greatest latest_by, and drops the latest_by
+        column. Rows with the same latest_by are ordered on their other columns, so the same row is kept on
+        every run.
+
+        Parameters:
+            df        : DataFrame, may hold several rows per key
+            key_cols  : columns identifying a row
+            latest_by : column ordering the rows of a key, e.g. the event timestamp ts
+    """
+    others = [c for c in df.columns if c not in key_cols and c != latest_by]
+    window = Window.partitionBy(*key_cols).orderBy(F.col(latest_by).desc(), *others)
+    return df.withColumn('_row', F.row_number().over(window))\
+             .filter(F.col('_row') == 1)\
+             .drop('_row', latest_by)
+
+
+def merge_partitions(spark, new_df, path, partition_cols, key_cols=None, max_records_per_file=0, num_files=None,
+                     latest_by=None):
+    """
+        Description: Merges new rows into an existing parquet table. Only the partitions that receive new rows are
+        read back, de-duplicated on key_cols together with the new rows, and overwritten; every other partition
+        is left untouched. Unpartitioned tables are rewritten as a whole. A new row replaces the existing row
+        with the same key, e.g. the new level of a user, as the ON CONFLICT DO UPDATE of the Postgres ETL.
+
+        Parameters:
+            spark                : Spark Session
+            new_df               : DataFrame with the new rows
+            path                 : root directory of the parquet table
+            partition_cols       : partition columns of the table, may be empty
+            key_cols             : columns identifying a row, None de-duplicates on all columns
+            max_records_per_file : see write_partitioned
+            num_files            : see write_partitioned
+            latest_by            : column of new_df ordering its rows, only the latest row of each key is merged
+                                   and the column is not written, see latest_rows. None keeps any of them.
+    """
+    partition_cols = list(partition_cols)
+    if key_cols and latest_by:
+        new_df = latest_rows(new_df, key_cols, latest_by)
+    fs, hpath = hadoop_path(spark, path)
+
+    if fs.exists(hpath):
+        existing = spark.read.parquet(path)
+        if partition_cols:
+            touched = new_df.select(*partition_cols).distinct()
+            existing = existing.join(touched, partition_cols, 'left_semi')
+        if key_cols:
+            # existing rows whose key comes again in the new rows are replaced by them
+            existing = existing.join(new_df.select(*key_cols).distinct(), list(key_cols), 'left_anti')
+        merged = existing.unionByName(new_df)
+        merged = merged.dropDuplicates(key_cols) if key_cols else merged.dropDuplicates()
+        # materialize before overwriting the partitions it was read from
+        merged = merged.localCheckpoint()
+    else:
+        merged = new_df
+
+    write_partitioned(merged, path, partition_cols, max_records_per_file, num_files)
@@ -1,110 +1,235 @@
+import argparse
 import os
-import glob
-import psycopg2
+import sys
 import pandas as pd
 from sql_queries import *
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+from common import checkpoint, db, indexes, json_reader, profiling, sampling
 
-def process_song_file(cur, filepath):
-    '''Reads songs log file row by row, selects needed fields and inserts them into song and artist tables.
+# checkpoint of the last songplay_id before the log_data pass, the rollups are refreshed from there
+ROLLUPS_LOADER = 'project_1a.rollups'
+
+
+def process_song_file(cur, df):
+    '''Inserts every song of a batch of song files into the song and artist tables.
+        Parameters:
+            cur (db.Transaction): Cursor of the sparkifydb database
+            df (DataFrame): Songs read with json_reader.SONG_SCHEMA
+    '''
+
+    # insert song records
+    for song_data in json_reader.iter_rows(df, ['song_id', 'title', 'artist_id', 'year', 'duration']):
+        cur.execute(song_table_insert, song_data)
+
+    # insert artist records
+    artist_columns = ['artist_id', 'artist_name', 'artist_location', 'artist_longitude', 'artist_latitude']
+    for artist_data in json_reader.iter_rows(df, artist_columns):
+        cur.execute(artist_table_insert, artist_data)
+
+
+def process_log_file(cur, df):
+    '''Filters a batch of user activity logs by NextSong, transforms the fields and inserts them
         Parameters:
-            cur (psycopg2.cursor()): Cursor of the sparkifydb database
-            filepath (str): Filepath(song_data/log_Data) of the file to be analyzed
+            cur (db.Transaction): Cursor of the sparkifydb database
+            df (DataFrame): Events read with json_reader.LOG_SCHEMA
     '''
-       
-    # open song file
-    df = pd.read_json(filepath, lines=True)
-    for value in df.values:
-        artist_id, artist_latitude, artist_location, artist_longitude, artist_name, duration, num_songs, song_id, title, year = value
-
-    # insert song record
-    song_data = [song_id, title, artist_id, year, duration]
-    cur.execute(song_table_insert, song_data)
-    
-    # insert artist record
-    artist_data = [artist_id, artist_name, artist_location, artist_longitude, artist_latitude]
-    cur.execute(artist_table_insert, artist_data)
-
-
-def process_log_file(cur, filepath):
-    '''Reads user activity log file row by row, filters by NexSong, selects needed fields, transforms them and inserts them'''
-    
-    # open log file
-    df = pd.read_json(filepath, lines=True)
 
     # filter by NextSong action
-    df = df[df['page']=='NextSong']
+    df = df[df['page']=='NextSong'].copy()
 
     # convert timestamp column to datetime
-    t = pd.to_datetime(df['ts'], unit='ms') 
-    
-    # insert time data records
-    time_data = []
-    for line in t:
-        time_data.append([line, line.hour, line.day, line.week, line.month, line.year, line.day_name()])
-        
-    column_labels = ('start_time', 'hour', 'day', 'week', 'month', 'year', 'weekday')
-    time_df = pd.DataFrame.from_records(time_data, columns=column_labels)
+    df['start_time'] = pd.to_datetime(df['ts'].astype('int64'), unit='ms')
+    t = df['start_time']
 
-    for i, row in time_df.iterrows():
-        cur.execute(time_table_insert, list(row))
-
-    # load user table
-    user_df = df[['userId', 'firstName', 'lastName', 'gender', 'level']]
+    # insert time data records
+    time_df = pd.DataFrame({
+        'start_time': t,
+        'hour': t.dt.hour,
+        'day': t.dt.day,
+        'week': t.dt.isocalendar().week.astype('int64'),
+        'month': t.dt.month,
+        'year': t.dt.year,
+        'weekday': t.dt.day_name(),
+    })
+
+    for time_data in json_reader.iter_rows(time_df, list(time_df.columns)):
+        cur.execute(time_table_insert, time_data)
 
     # insert user records
-    for i, row in user_df.iterrows():
-        cur.execute(user_table_insert, row)
+    for user_data in json_reader.iter_rows(df, ['userId', 'firstName', 'lastName', 'gender', 'level']):
+        cur.execute(user_table_insert, user_data)
 
     # insert songplay records
-    for index, row in df.iterrows():
-        
+    songplay_columns = ['start_time', 'userId', 'level', 'song', 'artist', 'length', 'sessionId', 'location', 'userAgent']
+    for start_time, user_id, level, song, artist, length, session_id, location, user_agent in json_reader.iter_rows(df, songplay_columns):
+
         # get songid and artistid from song and artist tables
-        cur.execute(song_select, (row.song, row.artist, row.length))
+        cur.execute(song_select, (song, artist, length))
         results = cur.fetchone()
-        
+
         if results:
             songid, artistid = results
         else:
             songid, artistid = None, None
 
         # insert songplay record
-        songplay_data = (pd.to_datetime(row.ts, unit='ms'), int(row.userId), row.level, songid, artistid, row.sessionId, row.location, row.userAgent) 
+        songplay_data = (start_time, int(user_id), level, songid, artistid, session_id, location, user_agent)
         cur.execute(songplay_table_insert, songplay_data)
 
 
-def process_data(cur, conn, filepath, func):
-    '''Walks through all files nested under filepath, and processes all logs found'''
+def read_batch(batch, schema, loader, sampler=sampling.ALL, sample_key=None):
+    '''Parses a batch of files, or reuses the frame cached by a previous attempt of the same load.
+        Parameters:
+            batch (list): paths of the files
+            schema (OrderedDict): Columns and dtypes of the files
+            loader (str): Name of the load, owner of the cache
+            sampler (sampling.Sampler): Sample of the records to keep
+            sample_key (str): Field of the records sampled by sampler, None to keep every record
+        Returns:
+            (DataFrame, json_reader.ParseStats) of the batch
+    '''
+    keep = sampler.record_filter(sample_key) if sample_key else None
+
+    def parse():
+        stats = json_reader.ParseStats()
+        return json_reader.read_batch(batch, schema, stats, keep), stats
+
+    return checkpoint.cached(checkpoint.cache_dir(loader), batch, parse, salt=_cache_salt(schema, sampler, sample_key))
+
+
+def _cache_salt(schema, sampler, sample_key):
+    return repr(list(schema.items())) + (' {} of {}'.format(sampler, sample_key) if sample_key and sampler.enabled else '')
+
+
+def process_data(conn, filepath, func, schema, resume=False, sampler=sampling.ALL, sample_key=None):
+    '''Reads all files nested under filepath in batches and processes every batch.
+    Each batch is committed with a checkpoint, with resume=True the files of the batches committed by a
+    previous run are skipped.
+    With a sampler, only the records whose sample_key is in the sample are read, or when sample_key is None
+    only the files whose name is in the sample.
+        Parameters:
+            conn (psycopg2.connection): Connection to the sparkifydb database, committed after every batch
+            filepath (str): Root directory of the files to process
+            func (function): Function processing the frame of a batch of files
+            schema (OrderedDict): Columns and dtypes of the files, json_reader.SONG_SCHEMA or LOG_SCHEMA
+            resume (bool): Continue after the last batch committed for filepath
+            sampler (sampling.Sampler): Sample of the input to process, everything by default
+            sample_key (str): Field of the records sampled, e.g. userId
+    '''
+
+    name = os.path.basename(os.path.normpath(filepath))
+    loader = 'project_1a.' + name
 
     # get all files matching extension from directory
-    all_files = []
-    for root, dirs, files in os.walk(filepath):
-        files = glob.glob(os.path.join(root,'*.json'))
-        for f in files :
-            all_files.append(os.path.abspath(f))
+    with profiling.stage(name + '.discover') as stage:
+        all_files = json_reader.list_json_files(filepath)
+        if sample_key is None:
+            all_files = sampler.paths(all_files)
+        stage.add(rows=len(all_files))
 
     # get total number of files found
     num_files = len(all_files)
     print('{} files found in {}'.format(num_files, filepath))
 
-    # iterate over files and process
-    for i, datafile in enumerate(all_files, 1):
-        func(cur, datafile)
-        conn.commit()
-        print('{}/{} files processed.'.format(i, num_files))
+    batches = [all_files[start:start + json_reader.FILES_PER_BATCH]
+               for start in range(0, num_files, json_reader.FILES_PER_BATCH)]
+    stats = json_reader.ParseStats()
+
+    def load_batch(tx, i):
+        with profiling.stage(name + '.parse') as stage:
+            df, batch_stats = read_batch(batches[i], schema, loader, sampler, sample_key)
+            stats.merge(batch_stats)
+            stage.add(rows=len(df), bytes=batch_stats.bytes)
+
+        with profiling.stage(name + '.load') as stage:
+            func(tx, df)
+            stage.add(rows=len(df))
+
+        print('{}/{} files processed.'.format(i * json_reader.FILES_PER_BATCH + len(batches[i]), num_files))
+
+    # read the files in batches and process, the last file of a batch (and the sample) identifies it in the checkpoint
+    def describe(i):
+        return batches[i][-1] if not sampler.enabled else '{} ({})'.format(batches[i][-1], sampler)
+
+    # only the batch in flight when a run fails is read back by a resume, the others are discarded once committed
+    def discard_batch(i):
+        checkpoint.discard(checkpoint.cache_dir(loader), batches[i], _cache_salt(schema, sampler, sample_key))
+
+    checkpoint.run_chunks(conn, loader, len(batches), load_batch, describe=describe, resume=resume,
+                          committed=discard_batch)
+    checkpoint.clear_cache(loader)
+
+    print('{}: {}'.format(filepath, stats))
+    for error in stats.errors:
+        print('    malformed record in {} line {}: {}'.format(*error))
+
+
+def refresh_rollups(conn, last_songplay_id):
+    '''Recomputes the songplays rollups for the days covered by the songplays inserted after last_songplay_id.
+    Rollup rows of the other days are left untouched.
+        Parameters:
+            conn (psycopg2.connection): Connection to the sparkifydb database
+            last_songplay_id (int): Highest songplay_id before the load
+    '''
+    cur = conn.cursor()
+    cur.execute(songplays_window_select, (last_songplay_id,))
+    start, end = cur.fetchone()
+    if start is None:
+        print('No new songplays, rollups are up to date.')
+        return
+
+    for delete_query, insert_query in rollup_queries:
+        cur.execute(delete_query, (start, end))
+        cur.execute(insert_query, (start, end))
+    conn.commit()
+    print('Rollups refreshed from {} to {}.'.format(start, end))
 
 
 def main():
     '''Function used to extract, transform all data from song and user activity logs and load it into a PostgreSQL DB
-    Usage: python etl.py / run them in any console /notebook
+    Every batch of files is committed with a checkpoint, after a failure run again with --resume to continue from there.
+    For development runs, --sample 0.01 --seed 42 only loads 1% of the song files and of the users, the same ones in every run.
+    Usage: python etl.py [--resume] [--sample FRACTION --seed N] / run them in any console /notebook
     '''
-    conn = psycopg2.connect("host=127.0.0.1 dbname=sparkifydb user=student password=student")
-    cur = conn.cursor()
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--resume", action="store_true", help="continue after the last batch committed by a failed run")
+    sampling.add_arguments(parser)
+    args = parser.parse_known_args()[0]
+    sampler = sampling.from_args(args)
+
+    profiling.start('project_1a_etl')
+
+    with db.connection() as conn:
+        checkpoint.ensure_table(conn)
+
+        process_data(conn, filepath='data/song_data', func=process_song_file,
+                     schema=json_reader.SONG_SCHEMA, resume=args.resume, sampler=sampler)
+
+        # songs and artists are loaded, index them for the song lookups of the log files
+        with profiling.stage('build_indexes'):
+            indexes.build_indexes(conn, index_catalog)
+
+        with db.transaction(conn, commit_every=0) as cur:
+            saved = checkpoint.load(cur, ROLLUPS_LOADER) if args.resume else None
+            if saved is not None:
+                last_songplay_id = saved[0]
+            else:
+                cur.execute(songplays_last_id_select)
+                last_songplay_id = cur.fetchone()[0]
+                checkpoint.save(cur, ROLLUPS_LOADER, last_songplay_id)
+
+        process_data(conn, filepath='data/log_data', func=process_log_file,
+                     schema=json_reader.LOG_SCHEMA, resume=args.resume, sampler=sampler, sample_key='userId')
+
+        with profiling.stage('refresh_rollups'):
+            refresh_rollups(conn, last_songplay_id)
 
-    process_data(cur, conn, filepath='data/song_data', func=process_song_file)
-    process_data(cur, conn, filepath='data/log_data', func=process_log_file)
+        with profiling.stage('plan_checks'):
+            indexes.assert_index_usage(conn, plan_checks)
 
-    conn.close()
+    db.close_pools()
+    profiling.finish()
 
 
 if __name__ == "__main__":
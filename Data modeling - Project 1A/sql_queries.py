@@ -4,11 +4,13 @@ user_table_drop = "DROP TABLE IF EXISTS users;"
 song_table_drop = "DROP TABLE IF EXISTS songs;"
 artist_table_drop = "DROP TABLE IF EXISTS artists;"
 time_table_drop = "DROP TABLE IF EXISTS time;"
+songplays_hourly_drop = "DROP TABLE IF EXISTS songplays_hourly;"
+songplays_daily_drop = "DROP TABLE IF EXISTS songplays_daily;"
 # CREATE TABLES
 songplay_table_create = ("""
     CREATE TABLE IF NOT EXISTS songplays (
         songplay_id SERIAL PRIMARY KEY,
-        start_time date,
+        start_time timestamp,
         user_id INT,
         level text,
         song_id text,
@@ -45,7 +47,7 @@ artist_table_create = ("""
 """)
 time_table_create = ("""
     CREATE TABLE IF NOT EXISTS time (
-        start_time date PRIMARY KEY,
+        start_time timestamp PRIMARY KEY,
         hour INT,
         day INT,
         week INT,
@@ -54,6 +56,25 @@ time_table_create = ("""
         weekday text
     );
 """)
+# rollups of songplays per hour/day, level and artist, read by the dashboards instead of songplays
+songplays_hourly_create = ("""
+    CREATE TABLE IF NOT EXISTS songplays_hourly (
+        start_hour timestamp NOT NULL,
+        level text,
+        artist_id text,
+        plays INT,
+        users INT
+    );
+""")
+songplays_daily_create = ("""
+    CREATE TABLE IF NOT EXISTS songplays_daily (
+        start_day date NOT NULL,
+        level text,
+        artist_id text,
+        plays INT,
+        users INT
+    );
+""")
 # INSERT RECORDS
 songplay_table_insert = ("""
     INSERT INTO songplays (start_time, user_id, level, song_id,
@@ -81,6 +102,44 @@ time_table_insert = ("""
     VALUES (%s, %s, %s, %s, %s, %s, %s)
     ON CONFLICT (start_time) DO NOTHING;
 """)
+# REFRESH ROLLUPS
+# days covered by the songplays inserted after a given songplay_id
+songplays_last_id_select = ("SELECT COALESCE(MAX(songplay_id), 0) FROM songplays;")
+songplays_window_select = ("""
+    SELECT date_trunc('day', MIN(start_time)), date_trunc('day', MAX(start_time)) + interval '1 day'
+    FROM songplays
+    WHERE songplay_id > %s;
+""")
+songplays_hourly_delete = ("DELETE FROM songplays_hourly WHERE start_hour >= %s AND start_hour < %s;")
+songplays_hourly_insert = ("""
+    INSERT INTO songplays_hourly (start_hour, level, artist_id, plays, users)
+    SELECT date_trunc('hour', start_time), level, artist_id, COUNT(*), COUNT(DISTINCT user_id)
+    FROM songplays
+    WHERE start_time >= %s AND start_time < %s
+    GROUP BY 1, 2, 3;
+""")
+songplays_daily_delete = ("DELETE FROM songplays_daily WHERE start_day >= %s AND start_day < %s;")
+songplays_daily_insert = ("""
+    INSERT INTO songplays_daily (start_day, level, artist_id, plays, users)
+    SELECT start_time::date, level, artist_id, COUNT(*), COUNT(DISTINCT user_id)
+    FROM songplays
+    WHERE start_time >= %s AND start_time < %s
+    GROUP BY 1, 2, 3;
+""")
+# DASHBOARD QUERIES, served by the rollups
+plays_per_hour_by_level = ("""
+    SELECT start_hour, level, SUM(plays) AS plays
+    FROM songplays_hourly
+    GROUP BY start_hour, level
+    ORDER BY start_hour, level;
+""")
+top_artists_per_day = ("""
+    SELECT r.start_day, a.name, SUM(r.plays) AS plays
+    FROM songplays_daily r
+    JOIN artists a ON a.artist_id = r.artist_id
+    GROUP BY r.start_day, a.name
+    ORDER BY r.start_day, plays DESC;
+""")
 # FIND SONGS
 song_select = ("""
     SELECT s.song_id, a.artist_id
@@ -88,6 +147,20 @@ song_select = ("""
     JOIN artists a ON s.artist_id = a.artist_id
     WHERE s.title = %s AND a.name = %s AND s.duration = %s;
 """)
+# INDEX CATALOG
+# indexes needed by each lookup the ETL runs, built once the tables they cover are loaded
+index_catalog = {
+    'song_select': [
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS songs_title_duration_idx ON songs (title, duration);",
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS artists_name_idx ON artists (name);",
+    ],
+}
+# queries that must not scan a large table, with sample parameters
+plan_checks = {
+    'song_select': (song_select, ('Der Kleine Dompfaff', 'Line Renaud', 152.92036)),
+}
 # QUERY LISTS
-create_table_queries = [songplay_table_create, user_table_create, song_table_create, artist_table_create, time_table_create]
-drop_table_queries = [songplay_table_drop, user_table_drop, song_table_drop, artist_table_drop, time_table_drop]
\ No newline at end of file
+table_names = ["songplays", "users", "songs", "artists", "time", "songplays_hourly", "songplays_daily"]
+create_table_queries = [songplay_table_create, user_table_create, song_table_create, artist_table_create, time_table_create, songplays_hourly_create, songplays_daily_create]
+drop_table_queries = [songplay_table_drop, user_table_drop, song_table_drop, artist_table_drop, time_table_drop, songplays_hourly_drop, songplays_daily_drop]
+rollup_queries = [(songplays_hourly_delete, songplays_hourly_insert), (songplays_daily_delete, songplays_daily_insert)]
\ No newline at end of file
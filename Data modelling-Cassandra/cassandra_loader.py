@@ -0,0 +1,158 @@
+import sys
+import time
+from collections import OrderedDict, namedtuple
+from itertools import islice
+
+from cassandra.cluster import Cluster
+from cassandra.concurrent import execute_concurrent
+from cassandra.query import BatchStatement, BatchType
+
+from data_model import TABLES, create_statement, insert_statement, row_values, partition_key_positions
+from preprocess import read_event_rows
+
+
+# name          : table name
+# create        : CREATE TABLE statement
+# insert        : INSERT statement with ? markers, prepared once per load
+# values        : function mapping a CSV line to the values bound to `insert`
+# partition_key : positions in `values` that make up the partition key, used to group batches
+TargetTable = namedtuple('TargetTable', ['name', 'create', 'insert', 'values', 'partition_key'])
+
+
+def target_table(table):
+    '''Builds the load definition of a table declared in data_model.'''
+    return TargetTable(table.name, create_statement(table), insert_statement(table),
+                       row_values(table), partition_key_positions(table))
+
+
+TARGET_TABLES = [target_table(table) for table in TABLES]
+
+
+def chunked(rows, size):
+    '''Groups an iterable of rows into lists of at most `size` rows.'''
+    rows = iter(rows)
+    while True:
+        chunk = list(islice(rows, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def create_tables(session, tables=TARGET_TABLES):
+    '''Creates every target table in the current keyspace.'''
+    for table in tables:
+        session.execute(table.create)
+
+
+def partition_batches(prepared, values_list, partition_key, batch_size):
+    '''Groups the rows of one table by partition key into UNLOGGED batches of at most `batch_size` statements.
+    Rows that are alone in their partition are sent as plain bound statements, a batch would only add overhead.
+        Parameters:
+            prepared (PreparedStatement): INSERT statement of the table
+            values_list (list): bound values of every row
+            partition_key (tuple): positions of the partition key columns in the values
+            batch_size (int): maximum number of statements per batch
+        Returns:
+            list of (statement, parameters) tuples for execute_concurrent
+    '''
+    partitions = OrderedDict()
+    for values in values_list:
+        key = tuple(values[i] for i in partition_key)
+        partitions.setdefault(key, []).append(values)
+
+    statements = []
+    for rows in partitions.values():
+        for start in range(0, len(rows), batch_size):
+            group = rows[start:start + batch_size]
+            if len(group) == 1:
+                statements.append((prepared, group[0]))
+                continue
+            batch = BatchStatement(batch_type=BatchType.UNLOGGED)
+            for values in group:
+                batch.add(prepared, values)
+            statements.append((batch, None))
+    return statements
+
+
+def load_events(session, rows, tables=TARGET_TABLES, concurrency=64, chunk_size=5000, batch_size=0):
+    '''Loads event rows into every target table in a single pass over the rows.
+    Each INSERT is prepared once, and the rows of every chunk are written with at most `concurrency` requests in flight.
+        Parameters:
+            session (cassandra.cluster.Session): session connected to the target keyspace
+            rows (iterable): CSV lines, e.g. from read_event_rows
+            tables (list): TargetTable definitions to fill
+            concurrency (int): maximum number of in-flight requests
+            chunk_size (int): number of rows read before writing them out
+            batch_size (int): if > 1, rows of the same partition are grouped into UNLOGGED batches of this size
+        Returns:
+            number of rows written per table
+    '''
+    prepared = [(table, session.prepare(table.insert)) for table in tables]
+    counts = OrderedDict((table.name, 0) for table in tables)
+
+    for chunk in chunked(rows, chunk_size):
+        statements = []
+        for table, insert in prepared:
+            values_list = [table.values(line) for line in chunk]
+            counts[table.name] += len(values_list)
+            if batch_size > 1:
+                statements.extend(partition_batches(insert, values_list, table.partition_key, batch_size))
+            else:
+                statements.extend((insert, values) for values in values_list)
+        execute_concurrent(session, statements, concurrency=concurrency, raise_on_first_error=True)
+
+    return counts
+
+
+def load_events_serially(session, rows, tables=TARGET_TABLES):
+    '''Reference loader: one synchronous execute per row and table, as done in the project notebook.'''
+    prepared = [(table, session.prepare(table.insert)) for table in tables]
+    counts = OrderedDict((table.name, 0) for table in tables)
+    for line in rows:
+        for table, insert in prepared:
+            session.execute(insert, table.values(line))
+            counts[table.name] += 1
+    return counts
+
+
+def benchmark(session, filepath, tables=TARGET_TABLES):
+    '''Times the serial, concurrent and concurrent+batched loaders on the same file and prints their throughput.'''
+    runs = [
+        ('serial', lambda rows: load_events_serially(session, rows, tables)),
+        ('concurrent', lambda rows: load_events(session, rows, tables)),
+        ('concurrent+batches', lambda rows: load_events(session, rows, tables, batch_size=20)),
+    ]
+    for name, load in runs:
+        for table in tables:
+            session.execute("TRUNCATE {}".format(table.name))
+        start = time.time()
+        counts = load(read_event_rows(filepath))
+        elapsed = time.time() - start
+        total = sum(counts.values())
+        print('{:<20} {:>8} inserts in {:7.2f}s, {:>9.0f} inserts/s'.format(name, total, elapsed, total / elapsed))
+
+
+def main():
+    '''Benchmarks the loaders against a local Cassandra
+    Usage: python cassandra_loader.py [event_datafile_new.csv] [host]
+    '''
+    filepath = sys.argv[1] if len(sys.argv) > 1 else 'event_datafile_new.csv'
+    host = sys.argv[2] if len(sys.argv) > 2 else '127.0.0.1'
+
+    cluster = Cluster([host])
+    session = cluster.connect()
+    session.execute("""
+    CREATE KEYSPACE IF NOT EXISTS sparkify
+    WITH REPLICATION = { 'class' : 'SimpleStrategy', 'replication_factor' : 1 }
+    """)
+    session.set_keyspace('sparkify')
+
+    create_tables(session)
+    benchmark(session, filepath)
+
+    session.shutdown()
+    cluster.shutdown()
+
+
+if __name__ == "__main__":
+    main()
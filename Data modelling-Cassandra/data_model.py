@@ -0,0 +1,195 @@
+import heapq
+import sys
+from collections import namedtuple
+
+from preprocess import EVENT_COLUMNS, read_event_rows
+
+
+# name   : column name in the Cassandra table
+# type   : CQL type, one of CQL_TYPES
+# source : column of event_datafile_new.csv the value comes from
+Column = namedtuple('Column', ['name', 'type', 'source'])
+
+# name           : table name
+# columns        : Column definitions, in table order
+# partition_key  : names of the partition key columns
+# clustering     : names of the clustering columns
+# select         : names of the columns returned by the query this table serves
+# where          : names of the columns the query restricts on, must be a prefix of the primary key
+Table = namedtuple('Table', ['name', 'columns', 'partition_key', 'clustering', 'select', 'where'])
+
+# CQL type -> (conversion from a csv value, approximate serialized size in bytes, None for variable length)
+CQL_TYPES = {
+    'int': (int, 4),
+    'bigint': (int, 8),
+    'float': (float, 4),
+    'double': (float, 8),
+    'text': (str, None),
+}
+
+# Cassandra starts to suffer above these partition sizes
+WIDE_PARTITION_ROWS = 100000
+WIDE_PARTITION_BYTES = 100 * 1024 * 1024
+
+
+# One table per query of the project
+TABLES = [
+    # 1. artist, song title and song's length heard during sessionId = 338, and itemInSession = 4
+    Table(
+        'songs_info_by_session',
+        [Column('sessionId', 'int', 'sessionId'),
+         Column('itemInSession', 'int', 'itemInSession'),
+         Column('artist', 'text', 'artist'),
+         Column('song_title', 'text', 'song'),
+         Column('song_length', 'float', 'length')],
+        partition_key=('sessionId',),
+        clustering=('itemInSession',),
+        select=('artist', 'song_title', 'song_length'),
+        where=('sessionId', 'itemInSession')),
+    # 2. artist, song (sorted by itemInSession) and user name for userid = 10, sessionid = 182
+    Table(
+        'artistsong_info_by_user',
+        [Column('user_id', 'int', 'userId'),
+         Column('sessionId', 'int', 'sessionId'),
+         Column('itemInSession', 'int', 'itemInSession'),
+         Column('artist', 'text', 'artist'),
+         Column('song', 'text', 'song'),
+         Column('firstname', 'text', 'firstName'),
+         Column('lastname', 'text', 'lastName')],
+        partition_key=('user_id', 'sessionId'),
+        clustering=('itemInSession',),
+        select=('itemInSession', 'artist', 'song', 'firstname', 'lastname'),
+        where=('user_id', 'sessionId')),
+    # 3. every user name who listened to the song 'All Hands Against His Own'
+    Table(
+        'user_music_app_history',
+        [Column('firstName', 'text', 'firstName'),
+         Column('lastName', 'text', 'lastName'),
+         Column('song', 'text', 'song'),
+         Column('userId', 'int', 'userId')],
+        partition_key=('song',),
+        clustering=('userId',),
+        select=('firstName', 'lastName'),
+        where=('song',)),
+]
+
+
+def create_statement(table):
+    '''Returns the CREATE TABLE statement of a declared table.'''
+    columns = ', '.join('{} {}'.format(c.name, c.type) for c in table.columns)
+    partition_key = ', '.join(table.partition_key)
+    if len(table.partition_key) > 1:
+        partition_key = '({})'.format(partition_key)
+    primary_key = ', '.join((partition_key,) + tuple(table.clustering))
+    return 'CREATE TABLE IF NOT EXISTS {} ({}, PRIMARY KEY({}))'.format(table.name, columns, primary_key)
+
+
+def insert_statement(table):
+    '''Returns the INSERT statement of a declared table, with a ? marker per column.'''
+    return 'INSERT INTO {} ({}) VALUES ({})'.format(
+        table.name, ', '.join(c.name for c in table.columns), ', '.join('?' for _ in table.columns))
+
+
+def select_statement(table):
+    '''Returns the SELECT statement of the query a declared table serves, with a ? marker per restricted column.'''
+    return 'SELECT {} FROM {} WHERE {}'.format(
+        ', '.join(table.select), table.name, ' AND '.join('{} = ?'.format(name) for name in table.where))
+
+
+def row_values(table):
+    '''Returns a function mapping a line of event_datafile_new.csv to the values of an INSERT into table.'''
+    converters = [(EVENT_COLUMNS.index(c.source), CQL_TYPES[c.type][0]) for c in table.columns]
+    return lambda line: tuple(convert(line[i]) for i, convert in converters)
+
+
+def _positions(table, names):
+    columns = [c.name for c in table.columns]
+    return tuple(columns.index(name) for name in names)
+
+
+def partition_key_positions(table):
+    '''Returns the positions of the partition key columns in the values returned by row_values.'''
+    return _positions(table, table.partition_key)
+
+
+def prepare_selects(session, tables=TABLES):
+    '''Prepares the SELECT of every declared table, returns them by table name.'''
+    return {table.name: session.prepare(select_statement(table)) for table in tables}
+
+
+def _row_size(table, values):
+    size = 0
+    for column, value in zip(table.columns, values):
+        fixed_size = CQL_TYPES[column.type][1]
+        size += fixed_size if fixed_size is not None else len(value.encode('utf8'))
+    return size
+
+
+def estimate_partition_sizes(tables, rows):
+    '''Computes the number of rows and approximate bytes of every partition of every table, in one pass over rows.
+    Rows sharing a primary key overwrite each other in Cassandra, they are counted once here as well.
+        Parameters:
+            tables (list): declared tables
+            rows (iterable): lines of event_datafile_new.csv, e.g. from cassandra_loader.read_event_rows
+        Returns:
+            {table name: {partition key: [rows, bytes]}}
+    '''
+    converters = [(table, row_values(table), partition_key_positions(table),
+                   _positions(table, tuple(table.partition_key) + tuple(table.clustering)))
+                  for table in tables]
+    sizes = {table.name: {} for table in tables}
+    seen = {table.name: set() for table in tables}
+
+    for line in rows:
+        for table, values_of, key_positions, primary_key_positions in converters:
+            values = values_of(line)
+            primary_key = tuple(values[i] for i in primary_key_positions)
+            if primary_key in seen[table.name]:
+                continue
+            seen[table.name].add(primary_key)
+            partition = sizes[table.name].setdefault(tuple(values[i] for i in key_positions), [0, 0])
+            partition[0] += 1
+            partition[1] += _row_size(table, values)
+    return sizes
+
+
+def print_partition_report(sizes, top=5):
+    '''Prints partition statistics per table and flags partitions that are too wide or get a large share of the rows.
+        Parameters:
+            sizes (dict): as returned by estimate_partition_sizes
+            top (int): number of largest partitions listed per table
+    '''
+    for name, partitions in sizes.items():
+        total_rows = sum(p[0] for p in partitions.values())
+        if not partitions:
+            print('{}: no rows'.format(name))
+            continue
+        print('{}: {} rows in {} partitions, {:.1f} rows per partition on average'.format(
+            name, total_rows, len(partitions), total_rows / len(partitions)))
+        for key, (num_rows, num_bytes) in heapq.nlargest(top, partitions.items(), key=lambda item: item[1][0]):
+            flags = []
+            if num_rows > WIDE_PARTITION_ROWS or num_bytes > WIDE_PARTITION_BYTES:
+                flags.append('WIDE')
+            if len(partitions) > 1 and num_rows > 10 * total_rows / len(partitions):
+                flags.append('HOT')
+            print('    {}: {} rows, {} bytes, {:.2%} of the table {}'.format(
+                key, num_rows, num_bytes, num_rows / total_rows, ' '.join(flags)))
+
+
+def main():
+    '''Prints the statements generated for every declared table and estimates their partition sizes
+    Usage: python data_model.py [event_datafile_new.csv]
+    '''
+    filepath = sys.argv[1] if len(sys.argv) > 1 else 'event_datafile_new.csv'
+
+    for table in TABLES:
+        print(create_statement(table))
+        print(insert_statement(table))
+        print(select_statement(table))
+        print()
+
+    print_partition_report(estimate_partition_sizes(TABLES, read_event_rows(filepath)))
+
+
+if __name__ == "__main__":
+    main()
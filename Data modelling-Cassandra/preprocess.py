@@ -0,0 +1,83 @@
+import csv
+import os
+import sys
+
+
+# Columns of event_datafile_new.csv, in file order
+EVENT_COLUMNS = ['artist', 'firstName', 'gender', 'itemInSession', 'lastName', 'length',
+                 'level', 'location', 'sessionId', 'song', 'userId']
+
+# Positions in the original event_data csv files of the columns kept in event_datafile_new.csv,
+# in EVENT_COLUMNS order (artist, firstName, gender, itemInSession, lastName, length, level,
+# location, sessionId, song, userId)
+EVENT_COLUMN_POSITIONS = (0, 2, 3, 4, 5, 6, 7, 8, 12, 13, 16)
+
+
+def list_event_files(filepath):
+    '''Returns the sorted paths of every csv file nested anywhere under filepath.'''
+    file_path_list = []
+    for root, dirs, files in os.walk(filepath):
+        for name in files:
+            if name.endswith('.csv'):
+                file_path_list.append(os.path.join(root, name))
+    return sorted(file_path_list)
+
+
+def stream_event_rows(file_path_list):
+    '''Yields the rows of every event file one at a time, projected on EVENT_COLUMNS.
+    Rows without an artist (i.e. events that are not song plays) are skipped.
+    Only one file is open and one row is held in memory at any time.
+        Parameters:
+            file_path_list (iterable): paths of the event_data csv files
+    '''
+    for f in file_path_list:
+        with open(f, 'r', encoding='utf8', newline='') as csvfile:
+            csvreader = csv.reader(csvfile)
+            next(csvreader, None)
+            for row in csvreader:
+                if row[0] == '':
+                    continue
+                yield [row[i] for i in EVENT_COLUMN_POSITIONS]
+
+
+def write_event_datafile(rows, filepath='event_datafile_new.csv'):
+    '''Writes projected event rows to filepath as they are produced.
+        Parameters:
+            rows (iterable): rows as yielded by stream_event_rows
+            filepath (str): destination csv file
+        Returns:
+            number of rows written, without the header
+    '''
+    num_rows = 0
+    with open(filepath, 'w', encoding='utf8', newline='') as f:
+        writer = csv.writer(f, quoting=csv.QUOTE_ALL, skipinitialspace=True)
+        writer.writerow(EVENT_COLUMNS)
+        for row in rows:
+            writer.writerow(row)
+            num_rows += 1
+    return num_rows
+
+
+def read_event_rows(filepath):
+    '''Yields the rows of event_datafile_new.csv one at a time, without the header.'''
+    with open(filepath, encoding='utf8') as f:
+        csvreader = csv.reader(f)
+        next(csvreader)
+        for line in csvreader:
+            yield line
+
+
+def main():
+    '''Consolidates the event_data csv files into event_datafile_new.csv
+    Usage: python preprocess.py [event_data directory] [output csv]
+    '''
+    filepath = sys.argv[1] if len(sys.argv) > 1 else os.path.join(os.getcwd(), 'event_data')
+    output = sys.argv[2] if len(sys.argv) > 2 else 'event_datafile_new.csv'
+
+    file_path_list = list_event_files(filepath)
+    num_rows = write_event_datafile(stream_event_rows(file_path_list), output)
+    print('{} rows from {} files written to {}'.format(num_rows, len(file_path_list), output))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,316 @@
+"""
+Generates a synthetic Sparkify data set with the layout of the course data:
+
+- song_data/A/B/C/TRABC....json : song metadata, SONG_SCHEMA records
+- log_data/YYYY/MM/YYYY-MM-DD-events.json : user activity, LOG_SCHEMA records
+- event_data/YYYY-MM-DD-events.csv : the same activity in the csv format of the Cassandra notebook
+
+Song popularity follows a Zipf law and session lengths a Pareto law, so the data has the hot songs and
+long sessions that make real loads uneven. The same seed always produces the same files.
+
+Usage: python generate_data.py OUTPUT_DIR [--scale 1] [--seed 42] [--song-skew 1.1] ...
+"""
+import argparse
+import bisect
+import csv
+import json
+import os
+import random
+import string
+import sys
+from datetime import datetime, timezone
+from itertools import accumulate
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+from common.json_reader import SONG_SCHEMA, LOG_SCHEMA
+
+
+# Columns of the event_data csv files: the log_data fields without userAgent
+EVENT_DATA_COLUMNS = [name for name in LOG_SCHEMA if name != 'userAgent']
+
+# Data set description written next to the files, read back by run_benchmark.py
+MANIFEST = '_manifest.json'
+
+FIRST_NAMES = ['Aleena', 'Ava', 'Chloe', 'Jacob', 'Kate', 'Lily', 'Mohammad', 'Rylan', 'Tegan', 'Wyatt']
+LAST_NAMES = ['Cruz', 'Harrell', 'Kirby', 'Klein', 'Levine', 'Koch', 'Rodriguez', 'Scott', 'George', 'Cuevas']
+LOCATIONS = ['San Francisco-Oakland-Hayward, CA', 'Portland-South Portland, ME', 'Lansing-East Lansing, MI',
+             'Chicago-Naperville-Elgin, IL-IN-WI', 'Atlanta-Sandy Springs-Roswell, GA', 'Tampa-St. Petersburg-Clearwater, FL']
+USER_AGENTS = ['"Mozilla/5.0 (Windows NT 6.1; WOW64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/36.0.1985.143 Safari/537.36"',
+               '"Mozilla/5.0 (Macintosh; Intel Mac OS X 10_9_4) AppleWebKit/537.77.4 (KHTML, like Gecko) Version/7.0.5 Safari/537.77.4"',
+               'Mozilla/5.0 (X11; Linux x86_64; rv:31.0) Gecko/20100101 Firefox/31.0']
+# Pages of the events that are not song plays, with their relative frequency
+OTHER_PAGES = ['Home', 'Home', 'Home', 'Logout', 'Settings', 'Help', 'Upgrade', 'Downgrade']
+
+DEFAULTS = {
+    'artists': 2000,
+    'songs': 10000,
+    'users': 100,
+    'events': 50000,
+}
+
+
+def random_id(rng, prefix, length=16):
+    return prefix + ''.join(rng.choice(string.ascii_uppercase + string.digits) for _ in range(length))
+
+
+def random_words(rng, count):
+    return ' '.join(rng.choice(string.ascii_uppercase) + ''.join(rng.choice(string.ascii_lowercase)
+                                                                  for _ in range(rng.randint(2, 8)))
+                    for _ in range(count))
+
+
+def zipf_weights(n, skew):
+    """
+    Cumulative Zipf weights of n ranks: rank k is drawn with probability proportional to 1 / k ** skew.
+    @param n: number of ranks
+    @param skew: 0 draws uniformly, larger values concentrate the draws on the first ranks
+    @return: cumulative weights, for random.choices or bisect
+    """
+    return list(accumulate(1.0 / (k ** skew) for k in range(1, n + 1)))
+
+
+def session_length(rng, alpha, mean, maximum):
+    """
+    Draws a number of events for a session from a Pareto law scaled to the given mean.
+    A small alpha gives a heavy tail of very long sessions.
+    """
+    scale = mean * (alpha - 1) / alpha if alpha > 1 else mean / 2
+    return max(1, min(maximum, int(scale * rng.paretovariate(alpha))))
+
+
+def generate_songs(rng, num_songs, num_artists):
+    """
+    Generates the song catalog, every record has the fields of SONG_SCHEMA.
+    """
+    artists = []
+    for _ in range(num_artists):
+        has_location = rng.random() < 0.5
+        artists.append({
+            'artist_id': random_id(rng, 'AR'),
+            'artist_latitude': round(rng.uniform(-60, 70), 5) if has_location else None,
+            'artist_longitude': round(rng.uniform(-150, 150), 5) if has_location else None,
+            'artist_location': rng.choice(LOCATIONS) if has_location else '',
+            'artist_name': random_words(rng, rng.randint(1, 3)),
+        })
+
+    songs = []
+    for _ in range(num_songs):
+        record = dict(rng.choice(artists))
+        record.update({
+            'num_songs': 1,
+            'song_id': random_id(rng, 'SO'),
+            'title': random_words(rng, rng.randint(1, 5)),
+            'duration': round(rng.uniform(60, 600), 5),
+            'year': rng.choice([0] + list(range(1960, 2019))),
+        })
+        songs.append({name: record[name] for name in SONG_SCHEMA})
+    return songs
+
+
+def generate_users(rng, num_users):
+    users = []
+    for user_id in range(1, num_users + 1):
+        users.append({
+            'userId': str(user_id),
+            'firstName': rng.choice(FIRST_NAMES),
+            'lastName': rng.choice(LAST_NAMES),
+            'gender': rng.choice('MF'),
+            'level': 'paid' if rng.random() < 0.2 else 'free',
+            'location': rng.choice(LOCATIONS),
+            'userAgent': rng.choice(USER_AGENTS),
+            'registration': float(rng.randint(1535000000000, 1541000000000)),
+        })
+    return users
+
+
+def generate_events(rng, songs, users, num_events, days, start, song_skew, session_alpha,
+                    session_mean, unknown_song_rate, play_rate):
+    """
+    Generates the events of every session, sorted by timestamp. Every record has the fields of LOG_SCHEMA.
+    Song plays draw their song from the catalog with Zipf popularity; a share of them play songs that are
+    not in the catalog, as in the course data.
+    """
+    song_weights = zipf_weights(len(songs), song_skew)
+    total_weight = song_weights[-1]
+    start_ms = int(start.timestamp() * 1000)
+    window_ms = days * 24 * 3600 * 1000
+
+    events = []
+    session_id = 0
+    while len(events) < num_events:
+        session_id += 1
+        user = rng.choice(users)
+        ts = start_ms + rng.randrange(window_ms)
+        length = session_length(rng, session_alpha, session_mean, num_events - len(events))
+        for item in range(length):
+            event = {name: None for name in LOG_SCHEMA}
+            event.update(user)
+            event.update({
+                'auth': 'Logged In', 'itemInSession': item, 'method': 'PUT', 'status': 200,
+                'sessionId': session_id, 'ts': ts,
+            })
+            if rng.random() < play_rate:
+                if rng.random() < unknown_song_rate:
+                    artist, title, duration = random_words(rng, 2), random_words(rng, 3), round(rng.uniform(60, 600), 5)
+                else:
+                    song = songs[min(len(songs) - 1, bisect.bisect(song_weights, rng.random() * total_weight))]
+                    artist, title, duration = song['artist_name'], song['title'], song['duration']
+                event.update({'page': 'NextSong', 'artist': artist, 'song': title, 'length': duration})
+                ts += int(duration * 1000)
+            else:
+                event.update({'page': rng.choice(OTHER_PAGES), 'method': 'GET'})
+                ts += rng.randint(1000, 60000)
+            events.append(event)
+    events.sort(key=lambda e: e['ts'])
+    return events
+
+
+def _chunks(records, size):
+    size = size if size and size > 0 else max(1, len(records))
+    return [records[i:i + size] for i in range(0, len(records), size)]
+
+
+def _write_json_lines(filepath, records):
+    os.makedirs(os.path.dirname(filepath), exist_ok=True)
+    with open(filepath, 'w', encoding='utf-8') as f:
+        for record in records:
+            f.write(json.dumps(record))
+            f.write('\n')
+
+
+def write_song_data(output, songs, songs_per_file):
+    """
+    Writes the songs under output/song_data/A/B/C/, songs_per_file records per file (1 in the course data).
+    @return: number of files written
+    """
+    chunks = _chunks(songs, songs_per_file)
+    for chunk in chunks:
+        song_id = chunk[0]['song_id']
+        directory = os.path.join(output, 'song_data', song_id[2], song_id[3], song_id[4])
+        _write_json_lines(os.path.join(directory, 'TR{}.json'.format(song_id[2:])), chunk)
+    return len(chunks)
+
+
+def _events_by_day(events):
+    days = {}
+    for event in events:
+        day = datetime.fromtimestamp(event['ts'] / 1000, tz=timezone.utc).strftime('%Y-%m-%d')
+        days.setdefault(day, []).append(event)
+    return days
+
+
+def write_log_data(output, events, events_per_file):
+    """
+    Writes the events under output/log_data/YYYY/MM/, one file per day, split in files of at most
+    events_per_file records if given.
+    @return: number of files written
+    """
+    num_files = 0
+    for day, day_events in sorted(_events_by_day(events).items()):
+        chunks = _chunks(day_events, events_per_file)
+        for part, chunk in enumerate(chunks):
+            suffix = '' if len(chunks) == 1 else '-{}'.format(part)
+            filepath = os.path.join(output, 'log_data', day[:4], day[5:7], '{}-events{}.json'.format(day, suffix))
+            _write_json_lines(filepath, chunk)
+            num_files += 1
+    return num_files
+
+
+def write_event_data(output, events, events_per_file):
+    """
+    Writes the events as the event_data csv files read by the Cassandra notebook, one file per day.
+    @return: number of files written
+    """
+    directory = os.path.join(output, 'event_data')
+    os.makedirs(directory, exist_ok=True)
+    num_files = 0
+    for day, day_events in sorted(_events_by_day(events).items()):
+        chunks = _chunks(day_events, events_per_file)
+        for part, chunk in enumerate(chunks):
+            suffix = '' if len(chunks) == 1 else '-{}'.format(part)
+            with open(os.path.join(directory, '{}-events{}.csv'.format(day, suffix)), 'w', encoding='utf8', newline='') as f:
+                writer = csv.writer(f)
+                writer.writerow(EVENT_DATA_COLUMNS)
+                for event in chunk:
+                    writer.writerow(['' if event[name] is None else event[name] for name in EVENT_DATA_COLUMNS])
+            num_files += 1
+    return num_files
+
+
+def generate(output, scale=1.0, seed=42, artists=None, songs=None, users=None, events=None, days=30,
+             start='2018-11-01', song_skew=1.1, session_alpha=1.5, session_mean=20, unknown_song_rate=0.1,
+             play_rate=0.8, songs_per_file=1, events_per_file=0):
+    """
+    Generates a complete data set under output and writes its manifest.
+    @param output: root directory of the data set
+    @param scale: multiplier applied to the default number of artists, songs, users and events
+    @param seed: seed of the random generator
+    @param artists, songs, users, events: explicit sizes, override scale
+    @param days: number of days covered by the events
+    @param start: first day of the events, YYYY-MM-DD
+    @param song_skew: Zipf exponent of song popularity, 0 for uniform
+    @param session_alpha: Pareto shape of session lengths, smaller means longer sessions
+    @param session_mean: mean number of events per session
+    @param unknown_song_rate: share of song plays whose song is not in the catalog
+    @param play_rate: share of events that are song plays (page NextSong)
+    @param songs_per_file: songs per song_data file
+    @param events_per_file: maximum events per log_data/event_data file, 0 for one file per day
+    @return: manifest dict
+    """
+    rng = random.Random(seed)
+    sizes = {name: int(value * scale) for name, value in DEFAULTS.items()}
+    for name, value in (('artists', artists), ('songs', songs), ('users', users), ('events', events)):
+        if value is not None:
+            sizes[name] = value
+
+    start_date = datetime.strptime(start, '%Y-%m-%d').replace(tzinfo=timezone.utc)
+    song_records = generate_songs(rng, sizes['songs'], sizes['artists'])
+    user_records = generate_users(rng, sizes['users'])
+    event_records = generate_events(rng, song_records, user_records, sizes['events'], days, start_date,
+                                    song_skew, session_alpha, session_mean, unknown_song_rate, play_rate)
+
+    manifest = {
+        'generated_at': datetime.now(timezone.utc).isoformat(),
+        'parameters': dict(sizes, seed=seed, scale=scale, days=days, start=start, song_skew=song_skew,
+                           session_alpha=session_alpha, session_mean=session_mean,
+                           unknown_song_rate=unknown_song_rate, play_rate=play_rate,
+                           songs_per_file=songs_per_file, events_per_file=events_per_file),
+        'files': {
+            'song_data': write_song_data(output, song_records, songs_per_file),
+            'log_data': write_log_data(output, event_records, events_per_file),
+            'event_data': write_event_data(output, event_records, events_per_file),
+        },
+        'rows': {'songs': len(song_records), 'events': len(event_records),
+                 'song_plays': sum(1 for e in event_records if e['page'] == 'NextSong')},
+    }
+    with open(os.path.join(output, MANIFEST), 'w') as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generates a synthetic Sparkify data set")
+    parser.add_argument("output", help="root directory of the data set")
+    parser.add_argument("--scale", type=float, default=1.0, help="multiplier of the default sizes {}".format(DEFAULTS))
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--artists", type=int)
+    parser.add_argument("--songs", type=int)
+    parser.add_argument("--users", type=int)
+    parser.add_argument("--events", type=int)
+    parser.add_argument("--days", type=int, default=30)
+    parser.add_argument("--start", default="2018-11-01", help="first day of the events, YYYY-MM-DD")
+    parser.add_argument("--song-skew", type=float, default=1.1, help="Zipf exponent of song popularity")
+    parser.add_argument("--session-alpha", type=float, default=1.5, help="Pareto shape of session lengths")
+    parser.add_argument("--session-mean", type=float, default=20, help="mean events per session")
+    parser.add_argument("--unknown-song-rate", type=float, default=0.1)
+    parser.add_argument("--play-rate", type=float, default=0.8)
+    parser.add_argument("--songs-per-file", type=int, default=1)
+    parser.add_argument("--events-per-file", type=int, default=0, help="0 for one file per day")
+    args = parser.parse_args()
+
+    manifest = generate(**{name: value for name, value in vars(args).items()})
+    print(json.dumps({'files': manifest['files'], 'rows': manifest['rows']}))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,285 @@
+"""
+Times the stages of the local Sparkify pipelines on a data set made by generate_data.py and stores the
+timings as JSON, one file per run, so runs can be compared over time.
+
+Pipelines:
+- postgres  : Data modeling - Project 1A, against the database configured by the SPARKIFY_DB_* variables.
+              Its tables are reset by the run.
+- spark     : Data lake etl, in Spark local mode, writing parquet under the work directory
+- cassandra : Data modelling-Cassandra preprocessing, partition report and load. The load goes to the
+              node given by --cassandra-host, or to an in-memory stand-in keyed like the Cassandra tables.
+
+Usage: python run_benchmark.py DATA_DIR [--pipelines postgres spark cassandra] [--scale 1] [--compare RESULT.json]
+"""
+import argparse
+import importlib.machinery
+import importlib.util
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import traceback
+from collections import OrderedDict
+from datetime import datetime, timezone
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir)
+sys.path.append(ROOT)
+
+import generate_data
+from common import profiling
+
+
+PROJECT_1A = os.path.join(ROOT, 'Data modeling - Project 1A')
+DATA_LAKE = os.path.join(ROOT, 'Data lake')
+CASSANDRA = os.path.join(ROOT, 'Data modelling-Cassandra')
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results')
+
+
+def _add_path(path):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+
+def run_postgres(profiler, data_dir, work_dir, args):
+    """
+    Resets the Project 1A schema, then loads song_data and log_data as etl.main does.
+    """
+    _add_path(PROJECT_1A)
+    import create_table
+    import etl
+    from sql_queries import create_table_queries, table_names, index_catalog
+    from common import checkpoint, db, indexes, json_reader, schema
+
+    if not db.database_exists():
+        cur, conn = create_table.create_database()
+        create_table.create_tables(cur, conn)
+        conn.close()
+
+    with db.connection() as conn:
+        with profiler.stage('reset'):
+            schema.swap_schema(conn, create_table_queries, table_names)
+            checkpoint.ensure_table(conn)
+            checkpoint.clear(conn)
+
+        with profiler.stage('song_data'):
+            etl.process_data(conn, os.path.join(data_dir, 'song_data'), etl.process_song_file, json_reader.SONG_SCHEMA)
+
+        with profiler.stage('indexes'):
+            indexes.build_indexes(conn, index_catalog)
+
+        with profiler.stage('log_data'):
+            with db.transaction(conn, commit_every=0) as cur:
+                cur.execute(etl.songplays_last_id_select)
+                last_songplay_id = cur.fetchone()[0]
+            etl.process_data(conn, os.path.join(data_dir, 'log_data'), etl.process_log_file, json_reader.LOG_SCHEMA)
+
+        with profiler.stage('rollups'):
+            etl.refresh_rollups(conn, last_songplay_id)
+
+    db.close_pools()
+
+
+def _load_data_lake_etl():
+    # the Data lake sources are kept as .txt files, load etl.py.txt under a name of its own
+    _add_path(DATA_LAKE)
+    path = os.path.join(DATA_LAKE, 'etl.py.txt')
+    loader = importlib.machinery.SourceFileLoader('data_lake_etl', path)
+    spec = importlib.util.spec_from_loader('data_lake_etl', loader)
+    module = importlib.util.module_from_spec(spec)
+    loader.exec_module(module)
+    return module
+
+
+def run_spark(profiler, data_dir, work_dir, args):
+    """
+    Runs the Data lake song and log passes in Spark local mode.
+    """
+    with profiler.stage('session'):
+        etl = _load_data_lake_etl()
+        spark = etl.create_spark_session()
+
+    input_data = os.path.abspath(data_dir) + '/'
+    output_data = os.path.join(os.path.abspath(work_dir), 'data_lake') + '/'
+    try:
+        with profiler.stage('song_data'):
+            etl.process_song_data(spark, input_data, output_data)
+        with profiler.stage('log_data'):
+            etl.process_log_data(spark, input_data, output_data)
+    finally:
+        spark.stop()
+
+
+def load_in_memory(rows, tables):
+    """
+    Cassandra stand-in: upserts every row into one dict per table keyed by its primary key, which is
+    what the cluster does with the INSERTs of the notebook.
+    @return: number of rows kept per table
+    """
+    from data_model import row_values
+
+    targets = []
+    for table in tables:
+        columns = [c.name for c in table.columns]
+        key = [columns.index(name) for name in tuple(table.partition_key) + tuple(table.clustering)]
+        targets.append((table.name, row_values(table), key, {}))
+
+    for line in rows:
+        for name, values_of, key, data in targets:
+            values = values_of(line)
+            data[tuple(values[i] for i in key)] = values
+    return OrderedDict((name, len(data)) for name, _, _, data in targets)
+
+
+def run_cassandra(profiler, data_dir, work_dir, args):
+    """
+    Consolidates the event_data csv files, estimates the partition sizes and loads the tables.
+    """
+    _add_path(CASSANDRA)
+    from preprocess import list_event_files, stream_event_rows, write_event_datafile, read_event_rows
+    from data_model import TABLES, estimate_partition_sizes
+
+    datafile = os.path.join(work_dir, 'event_datafile_new.csv')
+    with profiler.stage('preprocess'):
+        write_event_datafile(stream_event_rows(list_event_files(os.path.join(data_dir, 'event_data'))), datafile)
+
+    with profiler.stage('partition_sizes'):
+        estimate_partition_sizes(TABLES, read_event_rows(datafile))
+
+    if not args.cassandra_host:
+        with profiler.stage('load_in_memory'):
+            load_in_memory(read_event_rows(datafile), TABLES)
+        return
+
+    from cassandra.cluster import Cluster
+    import cassandra_loader
+
+    cluster = Cluster([args.cassandra_host])
+    session = cluster.connect()
+    try:
+        session.execute("""
+        CREATE KEYSPACE IF NOT EXISTS sparkify
+        WITH REPLICATION = { 'class' : 'SimpleStrategy', 'replication_factor' : 1 }
+        """)
+        session.set_keyspace('sparkify')
+        cassandra_loader.create_tables(session)
+        for table in cassandra_loader.TARGET_TABLES:
+            session.execute("TRUNCATE {}".format(table.name))
+        with profiler.stage('load'):
+            cassandra_loader.load_events(session, read_event_rows(datafile))
+    finally:
+        cluster.shutdown()
+
+
+PIPELINES = OrderedDict([
+    ('postgres', run_postgres),
+    ('spark', run_spark),
+    ('cassandra', run_cassandra),
+])
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=ROOT, stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(data_dir, pipelines, args):
+    """
+    Runs the pipelines one after the other; a failing pipeline is recorded and does not stop the others.
+    @param data_dir: data set made by generate_data.py
+    @param pipelines: names of the pipelines to run
+    @param args: parsed command line arguments
+    @return: result dict, as written to the results file
+    """
+    with open(os.path.join(data_dir, generate_data.MANIFEST)) as f:
+        manifest = json.load(f)
+
+    result = {
+        'started_at': datetime.now(timezone.utc).isoformat(),
+        'git_commit': git_commit(),
+        'host': {'platform': platform.platform(), 'python': platform.python_version(), 'cpus': os.cpu_count()},
+        'dataset': manifest,
+        'pipelines': OrderedDict(),
+    }
+
+    for name in pipelines:
+        # the stages of the pipeline code itself (parse, load, writes...) are recorded as well
+        profiler = profiling.start(name, enabled=True)
+        work_dir = tempfile.mkdtemp(prefix='sparkify-{}-'.format(name))
+        print('Running {}...'.format(name))
+        try:
+            PIPELINES[name](profiler, data_dir, work_dir, args)
+            status, error = 'ok', None
+        except Exception as e:
+            traceback.print_exc()
+            status, error = 'failed', '{}: {}'.format(type(e).__name__, e)
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+        summary = profiler.summary()
+        profiling.start('disabled', enabled=False)
+
+        result['pipelines'][name] = {
+            'status': status,
+            'error': error,
+            'stages': summary['stages'],
+            'total': summary['seconds'],
+        }
+        print('{}: {} in {:.2f}s'.format(name, status, summary['seconds']))
+    return result
+
+
+def compare(result, baseline):
+    """
+    Prints the duration of every stage next to its duration in a previous run.
+    """
+    print('{:<40} {:>10} {:>10} {:>8}'.format('stage', 'baseline', 'current', 'ratio'))
+    for name, pipeline in result['pipelines'].items():
+        previous = baseline['pipelines'].get(name, {})
+        durations = [(stage, stats['seconds'], previous.get('stages', {}).get(stage, {}).get('seconds'))
+                     for stage, stats in pipeline['stages'].items()]
+        durations.append(('total', pipeline['total'], previous.get('total')))
+        for stage, seconds, before in durations:
+            ratio = '{:.2f}x'.format(seconds / before) if before else '-'
+            print('{:<40} {:>10} {:>10.3f} {:>8}'.format(
+                '{}.{}'.format(name, stage), '-' if before is None else '{:.3f}'.format(before), seconds, ratio))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks the Sparkify pipelines on a synthetic data set")
+    parser.add_argument("data", help="data set directory, generated with --scale if it has no manifest")
+    parser.add_argument("--pipelines", nargs="+", choices=list(PIPELINES), default=list(PIPELINES))
+    parser.add_argument("--scale", type=float, default=1.0, help="scale of the data set generated if missing")
+    parser.add_argument("--seed", type=int, default=42, help="seed of the data set generated if missing")
+    parser.add_argument("--cassandra-host", help="Cassandra node to load, the in-memory stand-in is used if omitted")
+    parser.add_argument("--results", default=RESULTS_DIR, help="directory of the result files")
+    parser.add_argument("--compare", help="previous result file to compare this run with")
+    args = parser.parse_args()
+
+    if not os.path.exists(os.path.join(args.data, generate_data.MANIFEST)):
+        print('Generating a data set in {} (scale {})'.format(args.data, args.scale))
+        generate_data.generate(args.data, scale=args.scale, seed=args.seed)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+
+    result = run(args.data, args.pipelines, args)
+
+    os.makedirs(args.results, exist_ok=True)
+    filepath = os.path.join(args.results, datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%SZ') + '.json')
+    with open(filepath, 'w') as f:
+        json.dump(result, f, indent=2)
+    print('Results written to {}'.format(filepath))
+
+    if baseline is not None:
+        compare(result, baseline)
+
+
+if __name__ == "__main__":
+    main()
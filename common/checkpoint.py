@@ -0,0 +1,177 @@
+"""
+Resumable chunked loads for the Postgres ETLs.
+
+A load is split into numbered chunks (a batch of files, a slice of rows). Each chunk is written and
+committed in the same transaction as a row of the etl_checkpoints table recording how many chunks are
+done, so after a failure `run_chunks(..., resume=True)` continues right after the last committed chunk.
+Parsed chunks can be cached on disk with `cached`, so a retry does not parse its input again.
+"""
+import hashlib
+import os
+import pickle
+import shutil
+
+from common import db
+
+
+CHECKPOINT_TABLE = 'etl_checkpoints'
+
+CACHE_ROOT = os.environ.get('SPARKIFY_CACHE_DIR', '.etl_cache')
+
+create_checkpoint_table = """
+CREATE TABLE IF NOT EXISTS {} (
+    loader     VARCHAR PRIMARY KEY,
+    position   BIGINT NOT NULL,
+    detail     VARCHAR,
+    updated_at TIMESTAMP NOT NULL DEFAULT now()
+);
+""".format(CHECKPOINT_TABLE)
+
+checkpoint_select = "SELECT position, detail FROM {} WHERE loader = %s".format(CHECKPOINT_TABLE)
+
+checkpoint_upsert = """
+INSERT INTO {} (loader, position, detail, updated_at) VALUES (%s, %s, %s, now())
+ON CONFLICT (loader) DO UPDATE SET position = EXCLUDED.position, detail = EXCLUDED.detail, updated_at = now()
+""".format(CHECKPOINT_TABLE)
+
+
+def ensure_table(conn):
+    """
+    Creates the checkpoint table if needed.
+    @param conn: psycopg2 connection
+    """
+    cur = conn.cursor()
+    try:
+        cur.execute(create_checkpoint_table)
+        conn.commit()
+    finally:
+        cur.close()
+
+
+def load(cur, loader):
+    """
+    Returns the (position, detail) recorded for loader, None if it has no checkpoint.
+    @param cur: cursor or db.Transaction
+    @param loader: name of the load, e.g. "capstone.immigrations"
+    """
+    cur.execute(checkpoint_select, (loader,))
+    return cur.fetchone()
+
+
+def save(cur, loader, position, detail=None):
+    """
+    Records the progress of loader. Committed with the data of the chunk by the caller.
+    @param cur: cursor or db.Transaction
+    @param loader: name of the load
+    @param position: number of chunks done
+    @param detail: description of the last chunk done, checked when resuming
+    """
+    cur.execute(checkpoint_upsert, (loader, position, detail))
+
+
+def clear(conn, loaders=None):
+    """
+    Deletes the checkpoints of loaders, or all of them. Called when the tables are reset.
+    """
+    cur = conn.cursor()
+    try:
+        cur.execute("SELECT to_regclass(%s)", (CHECKPOINT_TABLE,))
+        if cur.fetchone()[0] is not None:
+            if loaders is None:
+                cur.execute("DELETE FROM {}".format(CHECKPOINT_TABLE))
+            else:
+                cur.execute("DELETE FROM {} WHERE loader = ANY(%s)".format(CHECKPOINT_TABLE), (list(loaders),))
+        conn.commit()
+    finally:
+        cur.close()
+
+
+def run_chunks(conn, loader, num_chunks, load_chunk, describe=None, resume=False, committed=None):
+    """
+    Loads chunks 0 .. num_chunks - 1 in order, committing each with its checkpoint.
+    @param conn: psycopg2 connection, the checkpoint table must exist (see ensure_table)
+    @param loader: name of the load
+    @param num_chunks: number of chunks of the load
+    @param load_chunk: function (db.Transaction, chunk index) writing one chunk, it must not commit
+    @param describe: function (chunk index) -> text identifying the chunk, compared with the checkpoint
+                     when resuming so a resume over different input fails instead of skipping data
+    @param resume: start after the last committed chunk instead of the first one
+    @param committed: function (chunk index) called once the chunk is committed, e.g. to discard its cache
+    @return: index of the first chunk loaded by this call
+    """
+    describe = describe or str
+    with db.transaction(conn, commit_every=0) as tx:
+        start = 0
+        saved = load(tx, loader) if resume else None
+        if saved is not None:
+            start, detail = saved
+            if start > num_chunks or (start > 0 and describe(start - 1) != detail):
+                raise ValueError("Checkpoint of {} ({} chunks, last {!r}) does not match the input, "
+                                 "run without --resume".format(loader, start, detail))
+            print('{}: resuming after {}/{} chunks'.format(loader, start, num_chunks))
+
+        for i in range(start, num_chunks):
+            load_chunk(tx, i)
+            save(tx, loader, i + 1, describe(i))
+            tx.commit()
+            if committed is not None:
+                committed(i)
+    return start
+
+
+def _fingerprint(paths, salt):
+    digest = hashlib.md5(salt.encode('utf-8'))
+    for path in paths:
+        stat = os.stat(path)
+        digest.update('{}|{}|{}\n'.format(os.path.abspath(path), stat.st_size, stat.st_mtime_ns).encode('utf-8'))
+    return digest.hexdigest()
+
+
+def _cache_file(cache_dir, paths, salt):
+    return os.path.join(cache_dir, _fingerprint(paths, salt) + '.pkl')
+
+
+def cached(cache_dir, paths, build, salt=''):
+    """
+    Returns build(), pickled under cache_dir and reused as long as the files in paths are unchanged.
+    @param cache_dir: directory of the cache files of one load
+    @param paths: input files of the cached value
+    @param build: function computing the value
+    @param salt: anything else the value depends on, e.g. the schema
+    """
+    cache_file = _cache_file(cache_dir, paths, salt)
+    if os.path.exists(cache_file):
+        with open(cache_file, 'rb') as f:
+            return pickle.load(f)
+
+    value = build()
+    os.makedirs(cache_dir, exist_ok=True)
+    with open(cache_file + '.tmp', 'wb') as f:
+        pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(cache_file + '.tmp', cache_file)
+    return value
+
+
+def discard(cache_dir, paths, salt=''):
+    """
+    Removes the value cached by `cached` for the same arguments, e.g. once the chunk it was parsed for is
+    committed and will not be read again.
+    """
+    try:
+        os.remove(_cache_file(cache_dir, paths, salt))
+    except FileNotFoundError:
+        pass
+
+
+def cache_dir(loader):
+    """
+    Returns the cache directory of a load, under SPARKIFY_CACHE_DIR.
+    """
+    return os.path.join(CACHE_ROOT, loader)
+
+
+def clear_cache(loader):
+    """
+    Removes the cached chunks of a load, once it completed.
+    """
+    shutil.rmtree(cache_dir(loader), ignore_errors=True)
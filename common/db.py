@@ -0,0 +1,186 @@
+"""
+Shared Postgres access for the Project 1A and Capstone scripts.
+
+Connection settings are read from one place (the SPARKIFY_DB_* environment variables, defaulting to the
+course workspace), connections come from a thread-safe pool, and `transaction` batches commits and runs
+repeated parametrized statements as server-side prepared statements.
+"""
+import hashlib
+import os
+import re
+import threading
+from contextlib import contextmanager
+
+import psycopg2
+from psycopg2.pool import ThreadedConnectionPool
+
+
+DB_CONFIG = {
+    'host': os.environ.get('SPARKIFY_DB_HOST', '127.0.0.1'),
+    'port': os.environ.get('SPARKIFY_DB_PORT', '5432'),
+    'user': os.environ.get('SPARKIFY_DB_USER', 'student'),
+    'password': os.environ.get('SPARKIFY_DB_PASSWORD', 'student'),
+}
+
+DEFAULT_DBNAME = os.environ.get('SPARKIFY_DB_NAME', 'sparkifydb')
+ADMIN_DBNAME = os.environ.get('SPARKIFY_ADMIN_DB_NAME', 'studentdb')
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def dsn(dbname=DEFAULT_DBNAME):
+    """
+    Builds the connection string of a database of the configured server.
+    @param dbname: database name
+    @return: libpq connection string
+    """
+    return "host={host} port={port} dbname={dbname} user={user} password={password}".format(dbname=dbname, **DB_CONFIG)
+
+
+def connect(dbname=DEFAULT_DBNAME):
+    """
+    Opens a new, unpooled connection, e.g. to run CREATE/DROP DATABASE.
+    """
+    return psycopg2.connect(dsn(dbname))
+
+
+def get_pool(dbname=DEFAULT_DBNAME, minconn=1, maxconn=8):
+    """
+    Returns the connection pool of a database, creating it on first use.
+    @param dbname: database name
+    @param minconn: connections opened when the pool is created
+    @param maxconn: maximum number of connections of the pool
+    @return: psycopg2 ThreadedConnectionPool
+    """
+    with _pools_lock:
+        pool = _pools.get(dbname)
+        if pool is None or pool.closed:
+            pool = ThreadedConnectionPool(minconn, maxconn, dsn(dbname))
+            _pools[dbname] = pool
+        return pool
+
+
+def close_pools():
+    """
+    Closes every connection of every pool.
+    """
+    with _pools_lock:
+        for pool in _pools.values():
+            pool.closeall()
+        _pools.clear()
+
+
+def database_exists(dbname=DEFAULT_DBNAME):
+    """
+    Tells whether a database exists on the configured server.
+    """
+    conn = connect(ADMIN_DBNAME)
+    try:
+        cur = conn.cursor()
+        cur.execute("SELECT 1 FROM pg_database WHERE datname = %s", (dbname,))
+        return cur.fetchone() is not None
+    finally:
+        conn.close()
+
+
+@contextmanager
+def connection(dbname=DEFAULT_DBNAME):
+    """
+    Borrows a connection from the pool of dbname and gives it back on exit.
+    Any transaction left open is rolled back before the connection is returned.
+    """
+    pool = get_pool(dbname)
+    conn = pool.getconn()
+    try:
+        yield conn
+    finally:
+        if not conn.closed:
+            conn.rollback()
+        pool.putconn(conn)
+
+
+def to_positional(query):
+    """
+    Converts a query with %s placeholders to $1, $2, ... placeholders, as expected by PREPARE.
+    """
+    counter = iter(range(1, query.count('%s') + 1))
+    return re.sub(r'%s', lambda _: '${}'.format(next(counter)), query)
+
+
+class Transaction:
+    """
+    Cursor-like wrapper that commits every `commit_every` statements and runs parametrized
+    statements through server-side prepared statements, so each distinct query is parsed and
+    planned once per connection.
+    """
+
+    def __init__(self, conn, commit_every=1000, prepare=True):
+        self.conn = conn
+        self.cursor = conn.cursor()
+        self.commit_every = commit_every
+        self.prepare = prepare
+        self.pending = 0
+        self._prepared = {}
+
+    def _statement_name(self, query):
+        name = self._prepared.get(query)
+        if name is not None:
+            return name
+
+        name = 'stmt_' + hashlib.md5(query.encode('utf-8')).hexdigest()[:16]
+        self.cursor.execute("SELECT 1 FROM pg_prepared_statements WHERE name = %s", (name,))
+        if self.cursor.fetchone() is None:
+            self.cursor.execute("PREPARE {} AS {}".format(name, to_positional(query)))
+        self._prepared[query] = name
+        return name
+
+    def execute(self, query, params=None):
+        """
+        Executes a statement, committing if `commit_every` statements ran since the last commit.
+        """
+        if params is not None and self.prepare:
+            params = list(params)
+            name = self._statement_name(query)
+            placeholders = ', '.join(['%s'] * len(params))
+            self.cursor.execute("EXECUTE {} ({})".format(name, placeholders), params)
+        else:
+            self.cursor.execute(query, params)
+
+        self.pending += 1
+        if self.commit_every and self.pending >= self.commit_every:
+            self.commit()
+
+    def fetchone(self):
+        return self.cursor.fetchone()
+
+    def fetchall(self):
+        return self.cursor.fetchall()
+
+    def commit(self):
+        self.conn.commit()
+        self.pending = 0
+
+    def rollback(self):
+        self.conn.rollback()
+        self.pending = 0
+
+
+@contextmanager
+def transaction(conn, commit_every=1000, prepare=True):
+    """
+    Yields a Transaction on conn. Pending statements are committed on exit, or rolled back on error.
+    @param conn: psycopg2 connection, e.g. from `connection`
+    @param commit_every: number of statements per commit, 0 commits only on exit
+    @param prepare: run parametrized statements as server-side prepared statements
+    """
+    tx = Transaction(conn, commit_every, prepare)
+    try:
+        yield tx
+    except Exception:
+        tx.rollback()
+        raise
+    else:
+        tx.commit()
+    finally:
+        tx.cursor.close()
@@ -0,0 +1,120 @@
+"""
+Post-load index builds and query plan checks for the Postgres schemas.
+
+Each project declares in its sql_queries an `index_catalog` (query name -> CREATE INDEX statements the
+query needs) and `plan_checks` (query name -> (query, sample parameters)).
+"""
+import json
+import re
+
+
+# Sequential scans are tolerated on tables smaller than this
+LARGE_TABLE_ROWS = 10000
+
+
+def _table_of(index_query):
+    match = re.search(r'\bON\s+([\w.]+)', index_query, re.IGNORECASE)
+    return match.group(1) if match else None
+
+
+def _index_of(index_query):
+    match = re.search(r'\bINDEX\s+(?:CONCURRENTLY\s+)?(?:IF\s+NOT\s+EXISTS\s+)?([\w.]+)\s+ON\b', index_query, re.IGNORECASE)
+    return match.group(1) if match else None
+
+
+def drop_index_queries(index_catalog):
+    """
+    Returns the DROP INDEX IF EXISTS statements of every index of the catalog, run before a bulk load into
+    emptied tables so the indexes are built after the load instead of being maintained row by row.
+    @param index_catalog: dict of query name -> list of CREATE INDEX statements
+    @return: list of DROP INDEX statements
+    """
+    names = []
+    for index_queries in index_catalog.values():
+        for query in index_queries:
+            name = _index_of(query)
+            if name is None:
+                raise ValueError("No index name in {!r}".format(query))
+            if name not in names:
+                names.append(name)
+    return ["DROP INDEX IF EXISTS {};".format(name) for name in names]
+
+
+def build_indexes(conn, index_catalog, queries=None):
+    """
+    Creates the indexes of the catalog and refreshes the statistics of their tables.
+    Indexes are meant to be declared with CREATE INDEX CONCURRENTLY IF NOT EXISTS, so they are built
+    without blocking writers and the build can be re-run; the statements run in autocommit mode.
+    @param conn: psycopg2 connection, with no transaction in progress
+    @param index_catalog: dict of query name -> list of CREATE INDEX statements
+    @param queries: names of the queries whose indexes are built, all of them if None
+    """
+    names = index_catalog.keys() if queries is None else queries
+    index_queries = [query for name in names for query in index_catalog[name]]
+
+    autocommit = conn.autocommit
+    conn.autocommit = True
+    cur = conn.cursor()
+    try:
+        tables = []
+        for query in index_queries:
+            cur.execute(query)
+            table = _table_of(query)
+            if table and table not in tables:
+                tables.append(table)
+        for table in tables:
+            cur.execute("ANALYZE {}".format(table))
+    finally:
+        cur.close()
+        conn.autocommit = autocommit
+
+
+def seq_scanned_tables(plan):
+    """
+    Returns the relations read by a Seq Scan anywhere in an EXPLAIN (FORMAT JSON) plan node.
+    """
+    tables = []
+    if plan.get('Node Type') == 'Seq Scan':
+        tables.append(plan['Relation Name'])
+    for child in plan.get('Plans', []):
+        tables.extend(seq_scanned_tables(child))
+    return tables
+
+
+def check_plans(conn, plan_checks, min_rows=LARGE_TABLE_ROWS):
+    """
+    Runs EXPLAIN on every known query and lists the sequential scans on large tables.
+    @param conn: psycopg2 connection
+    @param plan_checks: dict of query name -> (query, sample parameters)
+    @param min_rows: tables with fewer estimated rows are allowed to be scanned
+    @return: list of (query name, table, estimated rows) for every offending scan
+    """
+    failures = []
+    cur = conn.cursor()
+    try:
+        for name, (query, params) in plan_checks.items():
+            cur.execute("EXPLAIN (FORMAT JSON) " + query, params)
+            result = cur.fetchone()[0]
+            if isinstance(result, str):
+                result = json.loads(result)
+            for table in seq_scanned_tables(result[0]['Plan']):
+                cur.execute("SELECT reltuples::BIGINT FROM pg_class WHERE oid = %s::regclass", (table,))
+                rows = cur.fetchone()[0]
+                if rows >= min_rows:
+                    failures.append((name, table, rows))
+    finally:
+        cur.close()
+        conn.rollback()
+    return failures
+
+
+def assert_index_usage(conn, plan_checks, min_rows=LARGE_TABLE_ROWS):
+    """
+    Raises ValueError if any known query does a sequential scan on a large table.
+    """
+    failures = check_plans(conn, plan_checks, min_rows)
+    for name, table, rows in failures:
+        print("Plan check failed: {} scans the whole {} table (~{} rows)".format(name, table, rows))
+    if failures:
+        raise ValueError("Plan check failed for {}".format(", ".join(sorted({f[0] for f in failures}))))
+    print("Plan check passed for {} queries".format(len(plan_checks)))
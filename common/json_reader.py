@@ -0,0 +1,188 @@
+"""
+Batched, schema-validated reading of the Sparkify song_data and log_data JSON files.
+
+Both data sets are spread over many small files with one JSON record per line. Building a DataFrame per
+file dominates parse time, so files are read in batches: every record of a batch is validated against a
+fixed schema, appended column by column, and the batch becomes a single frame with fixed dtypes.
+Malformed records are skipped and counted instead of failing the whole load.
+"""
+import json
+import os
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+
+# column -> dtype, in the order of the files
+SONG_SCHEMA = OrderedDict([
+    ('num_songs', 'Int64'),
+    ('artist_id', 'string'),
+    ('artist_latitude', 'float64'),
+    ('artist_longitude', 'float64'),
+    ('artist_location', 'string'),
+    ('artist_name', 'string'),
+    ('song_id', 'string'),
+    ('title', 'string'),
+    ('duration', 'float64'),
+    ('year', 'Int64'),
+])
+
+LOG_SCHEMA = OrderedDict([
+    ('artist', 'string'),
+    ('auth', 'string'),
+    ('firstName', 'string'),
+    ('gender', 'string'),
+    ('itemInSession', 'Int64'),
+    ('lastName', 'string'),
+    ('length', 'float64'),
+    ('level', 'string'),
+    ('location', 'string'),
+    ('method', 'string'),
+    ('page', 'string'),
+    ('registration', 'float64'),
+    ('sessionId', 'Int64'),
+    ('song', 'string'),
+    ('status', 'Int64'),
+    ('ts', 'Int64'),
+    ('userAgent', 'string'),
+    ('userId', 'string'),
+])
+
+# Number of files read into one frame
+FILES_PER_BATCH = 500
+
+# Number of malformed records kept in ParseStats.errors
+MAX_ERRORS = 10
+
+
+def _to_string(value):
+    if value is None or isinstance(value, str):
+        return value
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return str(value)
+    raise ValueError('expected a string, got {!r}'.format(value))
+
+
+def _to_float(value):
+    if value is None or value == '':
+        return np.nan
+    if isinstance(value, bool):
+        raise ValueError('expected a number, got {!r}'.format(value))
+    return float(value)
+
+
+def _to_int(value):
+    if value is None or value == '':
+        return None
+    if isinstance(value, bool):
+        raise ValueError('expected an integer, got {!r}'.format(value))
+    if isinstance(value, float):
+        if not value.is_integer():
+            raise ValueError('expected an integer, got {!r}'.format(value))
+        return int(value)
+    return int(value)
+
+
+CONVERTERS = {
+    'string': _to_string,
+    'float64': _to_float,
+    'Int64': _to_int,
+}
+
+
+class ParseStats:
+    """
+    Counters of a read: files, bytes and records read, records skipped as malformed, and the first errors.
+    """
+
+    def __init__(self):
+        self.files = 0
+        self.bytes = 0
+        self.records = 0
+        self.malformed = 0
+        self.errors = []
+
+    def add_error(self, filepath, line_number, reason):
+        self.malformed += 1
+        if len(self.errors) < MAX_ERRORS:
+            self.errors.append((filepath, line_number, reason))
+
+    def merge(self, other):
+        """
+        Adds the counters of another read, e.g. of a batch read from a cache.
+        """
+        self.files += other.files
+        self.bytes += other.bytes
+        self.records += other.records
+        self.malformed += other.malformed
+        self.errors.extend(other.errors[:MAX_ERRORS - len(self.errors)])
+
+    def __str__(self):
+        return '{} files, {} bytes, {} records, {} malformed'.format(self.files, self.bytes, self.records, self.malformed)
+
+
+def list_json_files(root):
+    """
+    Lists every .json file under root, sorted so runs are reproducible.
+    @param root: directory of the data set, e.g. data/song_data
+    @return: list of absolute file paths
+    """
+    all_files = []
+    for dirpath, dirs, files in os.walk(root):
+        all_files.extend(os.path.abspath(os.path.join(dirpath, f)) for f in files if f.endswith('.json'))
+    return sorted(all_files)
+
+
+def _parse_into(columns, converters, filepath, stats, keep=None):
+    with open(filepath, encoding='utf-8') as f:
+        for line_number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+                if not isinstance(record, dict):
+                    raise ValueError('expected a JSON object')
+                if keep is not None and not keep(record):
+                    continue
+                values = [convert(record.get(name)) for name, convert in converters]
+            except (TypeError, ValueError) as e:
+                stats.add_error(filepath, line_number, str(e))
+                continue
+            for column, value in zip(columns, values):
+                column.append(value)
+            stats.records += 1
+    stats.files += 1
+    stats.bytes += os.path.getsize(filepath)
+
+
+def read_batch(filepaths, schema, stats=None, keep=None):
+    """
+    Reads JSON lines files into a single frame with the columns and dtypes of schema.
+    Missing fields are null, unknown fields are ignored, records that are not valid JSON objects or
+    whose values do not match the schema are skipped and counted in stats.
+    @param filepaths: files to read
+    @param schema: column -> dtype, e.g. SONG_SCHEMA or LOG_SCHEMA
+    @param stats: ParseStats updated with the counters of the read
+    @param keep: function (JSON object) -> bool, the records it rejects are skipped before any conversion
+                 and not counted, e.g. sampling.Sampler.record_filter
+    @return: DataFrame
+    """
+    stats = stats if stats is not None else ParseStats()
+    converters = [(name, CONVERTERS[dtype]) for name, dtype in schema.items()]
+    columns = [[] for _ in converters]
+    for filepath in filepaths:
+        _parse_into(columns, converters, filepath, stats, keep)
+
+    return pd.DataFrame({name: pd.array(values, dtype=dtype)
+                         for (name, dtype), values in zip(schema.items(), columns)})
+
+
+def iter_rows(df, columns):
+    """
+    Yields the values of columns for every row as tuples of plain Python values, nulls as None,
+    ready to be passed as query parameters.
+    """
+    values = [[None if pd.isna(v) else v for v in df[column].tolist()] for column in columns]
+    return zip(*values)
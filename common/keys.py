@@ -0,0 +1,163 @@
+"""
+Deterministic surrogate keys shared by the Spark, Postgres and Redshift pipelines.
+
+The same natural key gives the same key in every pipeline and in every run, so tables can be loaded
+incrementally and joined on a compact BIGINT. The natural keys used for the Sparkify model are:
+    - songs: title, artist_id
+    - songplays: user id, session id, ts (event epoch in milliseconds)
+The Airflow plugins ship a copy of the Redshift expression (helpers/keys.py). `python -m common.keys` checks
+that every implementation gives the same keys.
+"""
+import hashlib
+import importlib.util
+import os
+import sys
+
+
+# Natural key columns are joined with this separator before hashing
+KEY_SEPARATOR = '|'
+
+# 15 hex digits of the md5 digest = 60 bits, always fits a signed BIGINT
+KEY_HEX_DIGITS = 15
+
+
+def surrogate_key(*values):
+    """
+    Computes the surrogate key of a row from its natural key values.
+    None is hashed as an empty string, every other value through str().
+    @param values: natural key values, in a fixed order
+    @return: 60 bit integer key
+    """
+    text = KEY_SEPARATOR.join('' if value is None else str(value) for value in values)
+    return int(hashlib.md5(text.encode('utf-8')).hexdigest()[:KEY_HEX_DIGITS], 16)
+
+
+def sql_surrogate_key(*columns, dialect='redshift'):
+    """
+    Returns a SQL expression computing the same key as `surrogate_key` for the given columns.
+    @param columns: natural key column expressions, in the same order as in `surrogate_key`
+    @param dialect: 'redshift' or 'postgres'
+    @return: SQL expression of type BIGINT
+    """
+    concat = " || '{}' || ".format(KEY_SEPARATOR).join(
+        "COALESCE(CAST({} AS VARCHAR), '')".format(column) for column in columns)
+    digest = "LEFT(MD5({}), {})".format(concat, KEY_HEX_DIGITS)
+
+    if dialect == 'redshift':
+        return "STRTOL({}, 16)".format(digest)
+    if dialect == 'postgres':
+        return "('x' || {})::BIT({})::BIGINT".format(digest, KEY_HEX_DIGITS * 4)
+    raise ValueError("Unsupported SQL dialect: {}".format(dialect))
+
+
+def spark_surrogate_key(*columns):
+    """
+    Returns a Spark column computing the same key as `surrogate_key` for the given columns.
+    @param columns: natural key column names, in the same order as in `surrogate_key`
+    @return: pyspark Column of type long
+    """
+    from pyspark.sql import functions as F
+
+    concat = F.concat_ws(KEY_SEPARATOR, *[F.coalesce(F.col(c).cast('string'), F.lit('')) for c in columns])
+    return F.conv(F.substring(F.md5(concat), 1, KEY_HEX_DIGITS), 16, 10).cast('long')
+
+
+# Natural keys compared by check_implementations: text, integers, nulls and non-ASCII text
+SAMPLE_KEYS = [
+    ('10', '182', 1541903636796),
+    (None, '338', 0),
+    ('All Hands Against His Own', 'ARTC1LV1187B9A4858', None),
+    ('Déjà Vu', 'AR5KOSW1187FB35FF4', 2018),
+]
+
+PLUGIN_KEYS = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir,
+                           'Data Pipelines', '5-project', 'airflow', 'plugins', 'helpers', 'keys.py')
+
+
+def _plugin_sql_surrogate_key():
+    # the Airflow plugins ship their own copy of the Redshift expression, load it without importing Airflow
+    spec = importlib.util.spec_from_file_location('airflow_plugin_keys', PLUGIN_KEYS)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module.sql_surrogate_key
+
+
+def check_implementations(conn=None, spark=None, samples=SAMPLE_KEYS):
+    """
+    Checks that every implementation of the surrogate keys gives the same key for the same natural key:
+    the Airflow plugin expression must be the Redshift expression of `sql_surrogate_key`, and the keys computed
+    by Postgres (with conn) and by Spark (with spark) must equal `surrogate_key`.
+    @param conn: psycopg2 connection, the SQL keys are not computed if None
+    @param spark: Spark Session, the Spark keys are not computed if None
+    @param samples: natural keys to compare, tuples of the same length
+    @return: list of mismatch descriptions, empty if every implementation agrees
+    """
+    columns = ['c{}'.format(i) for i in range(len(samples[0]))]
+    expected = [surrogate_key(*values) for values in samples]
+    mismatches = []
+
+    if _plugin_sql_surrogate_key()(*columns) != sql_surrogate_key(*columns, dialect='redshift'):
+        mismatches.append('the Airflow plugin expression differs from sql_surrogate_key')
+
+    if conn is not None:
+        # the values are bound as text, as they are stored in the staging tables
+        expression = sql_surrogate_key(*columns, dialect='postgres')
+        cur = conn.cursor()
+        try:
+            for values, key in zip(samples, expected):
+                cur.execute("SELECT {} FROM (SELECT {}) AS t".format(
+                    expression, ', '.join('CAST(%s AS VARCHAR) AS {}'.format(c) for c in columns)),
+                    [None if value is None else str(value) for value in values])
+                sql_key = cur.fetchone()[0]
+                if sql_key != key:
+                    mismatches.append('postgres: {!r} -> {}, expected {}'.format(values, sql_key, key))
+        finally:
+            cur.close()
+            conn.rollback()
+
+    if spark is not None:
+        rows = [tuple(None if value is None else str(value) for value in values) for values in samples]
+        df = spark.createDataFrame(rows, 'c0 string' + ''.join(', {} string'.format(c) for c in columns[1:]))
+        spark_keys = [row[0] for row in df.select(spark_surrogate_key(*columns)).collect()]
+        for values, key, spark_key in zip(samples, expected, spark_keys):
+            if spark_key != key:
+                mismatches.append('spark: {!r} -> {}, expected {}'.format(values, spark_key, key))
+    return mismatches
+
+
+def main():
+    """
+    Compares the Python, SQL and Spark surrogate keys, and the Airflow plugin expression.
+    Postgres is reached through the SPARKIFY_DB_* variables and Spark runs in local mode; either is skipped
+    when it is not available.
+    Usage: python -m common.keys
+    """
+    conn = spark = None
+    try:
+        from common import db
+        conn = db.connect()
+    except Exception as e:
+        print('Postgres keys not checked: {}'.format(e))
+    try:
+        from pyspark.sql import SparkSession
+        spark = SparkSession.builder.master('local[1]').getOrCreate()
+    except Exception as e:
+        print('Spark keys not checked: {}'.format(e))
+
+    try:
+        mismatches = check_implementations(conn, spark)
+    finally:
+        if conn is not None:
+            conn.close()
+        if spark is not None:
+            spark.stop()
+
+    for mismatch in mismatches:
+        print(mismatch)
+    if mismatches:
+        sys.exit(1)
+    print('Surrogate keys match for {} natural keys'.format(len(SAMPLE_KEYS)))
+
+
+if __name__ == "__main__":
+    main()
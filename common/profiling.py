@@ -0,0 +1,233 @@
+"""
+Stage-level profiling of the ETL entry points.
+
+An entry point calls `start` once, wraps its stages in `with profiling.stage(name) as s:`, reports
+what a stage processed with `s.add(rows=..., bytes=...)`, and calls `finish` at the end, which writes a
+JSON summary of the run: time, calls, rows, bytes and peak memory per stage.
+
+Profiling is off unless the SPARKIFY_PROFILE environment variable is set, as a comma-separated list of:
+- time    : stage timings and counters
+- memory  : peak Python memory per stage, with tracemalloc (before Python 3.9 the peak cannot be reset per
+            stage, the peak of a stage is then the peak of the run so far, an upper bound)
+- cprofile: cProfile of the whole run, dumped next to the summary
+When off, `stage` returns a shared no-op context manager and nothing is measured.
+"""
+import cProfile
+import json
+import os
+import pstats
+import time
+import tracemalloc
+from collections import OrderedDict
+from datetime import datetime, timezone
+
+
+ENV_VAR = 'SPARKIFY_PROFILE'
+OUTPUT_DIR_ENV_VAR = 'SPARKIFY_PROFILE_DIR'
+
+# Functions listed in the summary when cProfile is on
+TOP_FUNCTIONS = 20
+
+
+class _NullStage:
+    """
+    Stage used when profiling is off: entering, leaving and counting do nothing.
+    """
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def add(self, rows=0, bytes=0):
+        pass
+
+
+_NULL_STAGE = _NullStage()
+
+
+class StageStats:
+    """
+    Totals of every run of a named stage.
+    """
+
+    def __init__(self):
+        self.calls = 0
+        self.seconds = 0.0
+        self.rows = 0
+        self.bytes = 0
+        self.peak_memory = None
+
+    def to_dict(self):
+        stats = OrderedDict([('calls', self.calls), ('seconds', round(self.seconds, 6)),
+                             ('rows', self.rows), ('bytes', self.bytes)])
+        if self.peak_memory is not None:
+            stats['peak_memory'] = self.peak_memory
+        return stats
+
+
+class _Stage:
+
+    def __init__(self, profiler, stats):
+        self.profiler = profiler
+        self.stats = stats
+        self.peak_seen = 0
+
+    def __enter__(self):
+        if self.profiler.memory:
+            parents = self.profiler._stack
+            current, peak = tracemalloc.get_traced_memory()
+            if parents:
+                # the peak is reset for this stage, keep the parent's peak so far
+                parents[-1].peak_seen = max(parents[-1].peak_seen, peak)
+            if hasattr(tracemalloc, 'reset_peak'):
+                tracemalloc.reset_peak()
+            self.start_memory = current
+        self.profiler._stack.append(self)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.stats.seconds += time.perf_counter() - self.start
+        self.stats.calls += 1
+        self.profiler._stack.pop()
+        if self.profiler.memory:
+            peak = max(tracemalloc.get_traced_memory()[1], self.peak_seen)
+            self.stats.peak_memory = max(self.stats.peak_memory or 0, peak - self.start_memory)
+            if self.profiler._stack:
+                parent = self.profiler._stack[-1]
+                parent.peak_seen = max(parent.peak_seen, peak)
+        return False
+
+    def add(self, rows=0, bytes=0):
+        """
+        Adds the rows and bytes processed by this run of the stage.
+        """
+        self.stats.rows += rows
+        self.stats.bytes += bytes
+
+
+class Profiler:
+    """
+    Collects the stage statistics of one run of an entry point.
+    """
+
+    def __init__(self, run_name, enabled=False, memory=False, cprofile=False):
+        self.run_name = run_name
+        self.enabled = enabled or memory or cprofile
+        self.memory = memory
+        self.cprofile = cProfile.Profile() if cprofile else None
+        self.stages = OrderedDict()
+        self._stack = []
+        self.started_at = datetime.now(timezone.utc)
+        self.start = time.perf_counter()
+
+        if self.memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        if self.cprofile is not None:
+            self.cprofile.enable()
+
+    def stage(self, name):
+        """
+        Returns a context manager timing one run of the named stage.
+        """
+        if not self.enabled:
+            return _NULL_STAGE
+        stats = self.stages.get(name)
+        if stats is None:
+            stats = self.stages[name] = StageStats()
+        return _Stage(self, stats)
+
+    def summary(self):
+        """
+        Returns the statistics of the run as a JSON-serializable dict.
+        """
+        summary = OrderedDict([
+            ('run', self.run_name),
+            ('started_at', self.started_at.isoformat()),
+            ('seconds', round(time.perf_counter() - self.start, 6)),
+            ('stages', OrderedDict((name, stats.to_dict()) for name, stats in self.stages.items())),
+        ])
+        if self.memory:
+            summary['peak_memory'] = tracemalloc.get_traced_memory()[1]
+        return summary
+
+    def finish(self, output_dir=None):
+        """
+        Stops the measures and writes the summary, and the cProfile dump if any, to output_dir.
+        @param output_dir: directory of the profile files, SPARKIFY_PROFILE_DIR or the working directory by default
+        @return: summary dict, None if profiling is off
+        """
+        if not self.enabled:
+            return None
+        if self.cprofile is not None:
+            self.cprofile.disable()
+
+        output_dir = output_dir or os.environ.get(OUTPUT_DIR_ENV_VAR, '.')
+        os.makedirs(output_dir, exist_ok=True)
+        prefix = os.path.join(output_dir, 'profile-{}-{}'.format(
+            self.run_name, self.started_at.strftime('%Y%m%dT%H%M%SZ')))
+
+        summary = self.summary()
+        if self.cprofile is not None:
+            self.cprofile.dump_stats(prefix + '.prof')
+            stats = pstats.Stats(self.cprofile)
+            top = sorted(stats.stats.items(), key=lambda item: item[1][3], reverse=True)[:TOP_FUNCTIONS]
+            summary['cprofile'] = OrderedDict([
+                ('dump', prefix + '.prof'),
+                ('top_cumulative', [OrderedDict([('function', '{}:{}({})'.format(*func)), ('calls', calls),
+                                                 ('seconds', round(cumtime, 6))])
+                                    for func, (_, calls, _, cumtime, _) in top]),
+            ])
+        if self.memory:
+            tracemalloc.stop()
+
+        with open(prefix + '.json', 'w') as f:
+            json.dump(summary, f, indent=2)
+        print('Profile of {} written to {}.json'.format(self.run_name, prefix))
+        return summary
+
+
+_active = Profiler('disabled')
+
+
+def options_from_env():
+    """
+    Reads the profiling options from SPARKIFY_PROFILE.
+    @return: dict of Profiler keyword arguments
+    """
+    flags = {flag.strip().lower() for flag in os.environ.get(ENV_VAR, '').split(',') if flag.strip()}
+    return {
+        'enabled': bool(flags - {'0', 'false', 'off'}),
+        'memory': 'memory' in flags,
+        'cprofile': 'cprofile' in flags,
+    }
+
+
+def start(run_name, **options):
+    """
+    Starts profiling a run and makes it the target of `stage`.
+    @param run_name: name of the entry point, used in the summary file name
+    @param options: Profiler options (enabled, memory, cprofile), read from SPARKIFY_PROFILE by default
+    @return: Profiler
+    """
+    global _active
+    settings = options_from_env()
+    settings.update(options)
+    _active = Profiler(run_name, **settings)
+    return _active
+
+
+def stage(name):
+    """
+    Context manager timing a stage of the current run, a no-op when profiling is off.
+    """
+    return _active.stage(name)
+
+
+def finish(output_dir=None):
+    """
+    Writes the summary of the current run, see Profiler.finish.
+    """
+    return _active.finish(output_dir)
@@ -0,0 +1,121 @@
+"""
+Deterministic sampling of the pipeline inputs, for fast development runs (--sample FRACTION --seed N).
+
+A record is kept when the hash of its sampling key, salted with the seed, falls in the first FRACTION of
+the hash range. The hash is `keys.surrogate_key(seed, key)`, computed the same way in Spark by
+`Sampler.spark_condition`, so a key is kept or left out in every table, every pipeline and every run with
+the same seed, and joins on that key between sampled tables stay valid. Records are left out as they are
+read: files sampled by name are never opened, rows of the files that are parsed are dropped before any
+transformation or load.
+
+Sampling keys of the inputs:
+    - song_data files: file name (the track id), skipped files are not read
+    - log_data events: userId, so a sampled user keeps all their sessions and songplays
+    - I94 immigration records: cicid
+    - temperature observations: dt, so every city keeps the same months
+"""
+import math
+import os
+
+from common.keys import KEY_HEX_DIGITS, KEY_SEPARATOR, surrogate_key
+
+
+# Keys are hashed to integers in [0, KEY_RANGE)
+KEY_RANGE = 1 << (KEY_HEX_DIGITS * 4)
+
+
+class Sampler:
+    """
+    Keeps a deterministic fraction of the keys, see the module documentation.
+    """
+
+    def __init__(self, fraction=1.0, seed=0):
+        if not 0 < fraction <= 1:
+            raise ValueError("Sample fraction must be in (0, 1], got {}".format(fraction))
+        self.fraction = fraction
+        self.seed = seed
+        self.threshold = int(fraction * KEY_RANGE)
+
+    @property
+    def enabled(self):
+        return self.fraction < 1
+
+    def keep(self, key):
+        """
+        Returns True if the records of key are in the sample. Null keys are never sampled.
+        Integral floats are keys of their integer, as the ids read from SAS or from nullable columns.
+        """
+        if not self.enabled:
+            return True
+        if key is None or key == '' or (isinstance(key, float) and math.isnan(key)):
+            return False
+        if isinstance(key, float) and key.is_integer():
+            key = int(key)
+        return surrogate_key(self.seed, key) < self.threshold
+
+    def mask(self, series):
+        """
+        Returns the boolean Series of the values of a pandas Series that are in the sample.
+        """
+        return series.map(self.keep, na_action='ignore').eq(True)
+
+    def filter(self, df, column):
+        """
+        Returns the rows of a pandas DataFrame whose value of column is in the sample.
+        """
+        return df[self.mask(df[column])] if self.enabled else df
+
+    def paths(self, paths):
+        """
+        Returns the files whose name, without directory and extension, is in the sample.
+        """
+        if not self.enabled:
+            return paths
+        return [path for path in paths if self.keep(os.path.splitext(os.path.basename(path))[0])]
+
+    def record_filter(self, field):
+        """
+        Returns a function (JSON object) -> bool keeping the records whose field is in the sample, for
+        json_reader.read_batch, or None when not sampling.
+        """
+        if not self.enabled:
+            return None
+        return lambda record: self.keep(record.get(field))
+
+    def spark_condition(self, column):
+        """
+        Returns a Spark condition keeping the rows whose column is in the sample, same keys as `keep`.
+        @param column: name of a string or integer column
+        @return: pyspark Column of type boolean
+        """
+        from pyspark.sql import functions as F
+
+        if not self.enabled:
+            return F.lit(True)
+        text = F.col(column).cast('string')
+        digest = F.md5(F.concat_ws(KEY_SEPARATOR, F.lit(str(self.seed)), text))
+        key = F.conv(F.substring(digest, 1, KEY_HEX_DIGITS), 16, 10).cast('long')
+        return text.isNotNull() & (text != '') & (key < F.lit(self.threshold))
+
+    def __str__(self):
+        return 'sample {} seed {}'.format(self.fraction, self.seed) if self.enabled else 'no sample'
+
+
+# Sampler keeping everything
+ALL = Sampler()
+
+
+def add_arguments(parser):
+    """
+    Adds the --sample and --seed options to an argparse parser.
+    """
+    parser.add_argument("--sample", type=float, default=1.0, metavar="FRACTION",
+                        help="only process this deterministic fraction of the input keys, e.g. 0.01")
+    parser.add_argument("--seed", type=int, default=0, help="seed of --sample, the same seed keeps the same keys")
+
+
+def from_args(args):
+    """
+    Returns the Sampler of parsed --sample and --seed options.
+    """
+    return Sampler(args.sample, args.seed)
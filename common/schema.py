@@ -0,0 +1,55 @@
+"""
+Fast resets of the Postgres schemas, as an alternative to dropping and recreating the whole database.
+"""
+
+SHADOW_SCHEMA = 'shadow'
+
+
+def swap_schema(conn, create_table_queries, table_names, schema='public', shadow=SHADOW_SCHEMA):
+    """
+    Creates fresh tables in a shadow schema and moves them in place of the live ones.
+    Everything runs in a single transaction, readers see either the old or the new tables.
+    @param conn: psycopg2 connection to the database
+    @param create_table_queries: CREATE TABLE statements with unqualified table names
+    @param table_names: names of the tables created by create_table_queries
+    @param schema: schema the tables are swapped into
+    @param shadow: name of the temporary schema
+    """
+    cur = conn.cursor()
+    try:
+        cur.execute("DROP SCHEMA IF EXISTS {} CASCADE".format(shadow))
+        cur.execute("CREATE SCHEMA {}".format(shadow))
+        cur.execute("SET LOCAL search_path TO {}".format(shadow))
+        for query in create_table_queries:
+            cur.execute(query)
+
+        for table in table_names:
+            cur.execute("DROP TABLE IF EXISTS {}.{} CASCADE".format(schema, table))
+            cur.execute("ALTER TABLE {}.{} SET SCHEMA {}".format(shadow, table, schema))
+        cur.execute("DROP SCHEMA {} CASCADE".format(shadow))
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cur.close()
+
+
+def truncate_tables(conn, table_names, pre_load_queries=()):
+    """
+    Empties every table in a single statement and resets their SERIAL/IDENTITY sequences.
+    @param conn: psycopg2 connection to the database
+    @param table_names: tables to empty
+    @param pre_load_queries: statements run first, e.g. to drop constraints that are built after the load
+    """
+    cur = conn.cursor()
+    try:
+        for query in pre_load_queries:
+            cur.execute(query)
+        cur.execute("TRUNCATE {} RESTART IDENTITY CASCADE".format(", ".join(table_names)))
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cur.close()